@@ -5,6 +5,7 @@ from micropython import const
 from collections import deque
 import bluetooth
 import asyncio
+import time
 
 from .core import (
     ensure_active,
@@ -15,7 +16,7 @@ from .core import (
     register_irq_handler,
     GattError,
 )
-from .device import DeviceConnection, DeviceTimeout
+from .device import DeviceConnection, DeviceTimeout, DeviceDisconnectedError
 
 _registered_characteristics = {}
 
@@ -41,6 +42,9 @@ _FLAG_WRITE_CAPTURE = const(0x10000)
 
 _WRITE_CAPTURE_QUEUE_LIMIT = const(10)
 
+_ENOMEM = const(12)
+_NOTIFY_BACKOFF_MAX_MS = const(64)
+
 
 def _server_irq(event, data):
     if event == _IRQ_GATTS_WRITE:
@@ -52,17 +56,14 @@ def _server_irq(event, data):
     elif event == _IRQ_GATTS_INDICATE_DONE:
         conn_handle, value_handle, status = data
         Characteristic._indicate_done(conn_handle, value_handle, status)
+        # The controller sent something, so stalled notify_streams may retry.
+        for flag in Characteristic._tx_waiters:
+            flag.set()
 
 
 def _server_shutdown():
     global _registered_characteristics
     _registered_characteristics = {}
-    if hasattr(BaseCharacteristic, "_capture_task"):
-        BaseCharacteristic._capture_task.cancel()
-        del BaseCharacteristic._capture_queue
-        del BaseCharacteristic._capture_write_event
-        del BaseCharacteristic._capture_consumed_event
-        del BaseCharacteristic._capture_task
 
 
 register_irq_handler(_server_irq, _server_shutdown)
@@ -100,42 +101,6 @@ class BaseCharacteristic:
         else:
             ble.gatts_write(self._value_handle, data, send_update)
 
-    # When the a capture-enabled characteristic is created, create the
-    # necessary events (if not already created).
-    @staticmethod
-    def _init_capture():
-        if hasattr(BaseCharacteristic, "_capture_queue"):
-            return
-
-        BaseCharacteristic._capture_queue = deque((), _WRITE_CAPTURE_QUEUE_LIMIT)
-        BaseCharacteristic._capture_write_event = asyncio.ThreadSafeFlag()
-        BaseCharacteristic._capture_consumed_event = asyncio.ThreadSafeFlag()
-        BaseCharacteristic._capture_task = asyncio.create_task(
-            BaseCharacteristic._run_capture_task()
-        )
-
-    # Monitor the shared queue for incoming characteristic writes and forward
-    # them sequentially to the individual characteristic events.
-    @staticmethod
-    async def _run_capture_task():
-        write = BaseCharacteristic._capture_write_event
-        consumed = BaseCharacteristic._capture_consumed_event
-        q = BaseCharacteristic._capture_queue
-
-        while True:
-            if len(q):
-                conn, data, characteristic = q.popleft()
-                # Let the characteristic waiting in `written()` know that it
-                # can proceed.
-                characteristic._write_data = (conn, data)
-                characteristic._write_event.set()
-                # Wait for the characteristic to complete `written()` before
-                # continuing.
-                await consumed.wait()
-
-            if not len(q):
-                await write.wait()
-
     # Wait for a write on this characteristic. Returns the connection that did
     # the write, or a tuple of (connection, value) if capture is enabled for
     # this characteristics.
@@ -144,26 +109,26 @@ class BaseCharacteristic:
             # Not a writable characteristic.
             return
 
+        if self.flags & _FLAG_WRITE_CAPTURE:
+            # Each capture characteristic has its own queue, so waiting here
+            # never holds up writes to another characteristic.
+            q = self._capture_queue
+            with DeviceTimeout(None, timeout_ms):
+                while not len(q):
+                    await self._write_event.wait()
+            # A tuple of (connection, received_data), oldest first.
+            return q.popleft()
+
         # If no write has been seen then we need to wait. If the event has
         # already been set this will clear the event and continue
-        # immediately. In regular mode, this is set by the write IRQ
-        # directly (in _remote_write). In capture mode, this is set when it's
-        # our turn by _capture_task.
+        # immediately. This is set by the write IRQ directly (in
+        # _remote_write).
         with DeviceTimeout(None, timeout_ms):
             await self._write_event.wait()
 
-        # Return the write data and clear the stored copy.
-        # In default usage this will be just the connection handle.
-        # In capture mode this will be a tuple of (connection_handle, received_data)
+        # Return the connection of the write and clear the stored copy.
         data = self._write_data
         self._write_data = None
-
-        if self.flags & _FLAG_WRITE_CAPTURE:
-            # Notify the shared queue monitor that the event has been consumed
-            # by the caller to `written()` and another characteristic can now
-            # proceed.
-            BaseCharacteristic._capture_consumed_event.set()
-
         return data
 
     def on_read(self, connection):
@@ -178,11 +143,11 @@ class BaseCharacteristic:
 
             if characteristic.flags & _FLAG_WRITE_CAPTURE:
                 # For capture, we append the connection and the written value
-                # value to the shared queue along with the matching characteristic object.
-                # The deque will enforce the max queue len.
+                # to this characteristic's queue. The deque will enforce the
+                # max queue len.
                 data = characteristic.read()
-                BaseCharacteristic._capture_queue.append((conn, data, characteristic))
-                BaseCharacteristic._capture_write_event.set()
+                characteristic._capture_queue.append((conn, data))
+                characteristic._write_event.set()
             else:
                 # Store the write connection handle to be later used to retrieve the data
                 # then set event to handle in written() task.
@@ -195,6 +160,10 @@ class BaseCharacteristic:
 
 
 class Characteristic(BaseCharacteristic):
+    # One flag per waiting notify_stream (a ThreadSafeFlag allows a single
+    # waiter), all set when the stack finished an indication.
+    _tx_waiters = []
+
     def __init__(
         self,
         service,
@@ -222,22 +191,23 @@ class Characteristic(BaseCharacteristic):
                 # their values (and connection) in a queue. Otherwise we just
                 # track the connection of the most recent write.
                 flags |= _FLAG_WRITE_CAPTURE
-                BaseCharacteristic._init_capture()
+                self._capture_queue = deque((), _WRITE_CAPTURE_QUEUE_LIMIT)
 
-            # Set when this characteristic has a value waiting in self._write_data.
+            # Set when this characteristic has a value waiting in
+            # self._write_data (or in self._capture_queue).
             self._write_event = asyncio.ThreadSafeFlag()
-            # The connection of the most recent write, or a tuple of
-            # (connection, data) if capture is enabled.
+            # The connection of the most recent write.
             self._write_data = None
         if notify:
             flags |= _FLAG_NOTIFY
+            # Chunks notify_stream had to retry because the TX queue was full.
+            self.notify_retries = 0
         if indicate:
             flags |= _FLAG_INDICATE
-            # TODO: This should probably be a dict of connection to (ev, status).
-            # Right now we just support a single indication at a time.
-            self._indicate_connection = None
-            self._indicate_event = asyncio.ThreadSafeFlag()
-            self._indicate_status = None
+            # Map of connection handle to [event, status] of the indication
+            # in progress to that connection, so each connection can have
+            # one outstanding at a time.
+            self._indications = {}
 
         self.uuid = uuid
         self.flags = flags
@@ -257,36 +227,80 @@ class Characteristic(BaseCharacteristic):
             raise ValueError("Not supported")
         ble.gatts_notify(connection._conn_handle, self._value_handle, data)
 
+    # Send buf as notifications of at most chunk_size bytes, as fast as the
+    # controller accepts them. gatts_notify fails with ENOMEM while the
+    # controller's TX queue is full; the stream then waits on its own flag in
+    # _tx_waiters (set by the IRQ when an indication completes, the only
+    # transmission the stack reports) or for a backoff that doubles from 1 ms
+    # up to 64 ms, and retries the same chunk. Several streams (one per host)
+    # can wait at once. Raises
+    # DeviceDisconnectedError if the connection drops and asyncio.TimeoutError
+    # if no chunk was accepted for timeout_ms. Returns bytes per second.
+    async def notify_stream(self, connection, buf, chunk_size=20, timeout_ms=2000):
+        if not (self.flags & _FLAG_NOTIFY):
+            raise ValueError("Not supported")
+        view = memoryview(buf)
+        start = time.ticks_ms()
+        accepted = start
+        backoff_ms = 1
+        tx_event = None
+        n = 0
+        while n < len(view):
+            if not connection.is_connected():
+                raise DeviceDisconnectedError
+            try:
+                ble.gatts_notify(connection._conn_handle, self._value_handle, view[n : n + chunk_size])
+            except OSError as e:
+                if e.errno != _ENOMEM:
+                    raise
+                self.notify_retries += 1
+                if time.ticks_diff(time.ticks_ms(), accepted) > timeout_ms:
+                    raise asyncio.TimeoutError
+                if tx_event is None:
+                    tx_event = asyncio.ThreadSafeFlag()
+                Characteristic._tx_waiters.append(tx_event)
+                try:
+                    await asyncio.wait_for_ms(tx_event.wait(), backoff_ms)
+                except asyncio.TimeoutError:
+                    backoff_ms = min(backoff_ms * 2, _NOTIFY_BACKOFF_MAX_MS)
+                finally:
+                    Characteristic._tx_waiters.remove(tx_event)
+                continue
+            n += chunk_size
+            accepted = time.ticks_ms()
+            backoff_ms = 1
+            # Let other tasks (e.g. capture writes) run between chunks.
+            await asyncio.sleep_ms(0)
+        elapsed_ms = max(time.ticks_diff(time.ticks_ms(), start), 1)
+        return len(view) * 1000 // elapsed_ms
+
     async def indicate(self, connection, data=None, timeout_ms=1000):
         if not (self.flags & _FLAG_INDICATE):
             raise ValueError("Not supported")
-        if self._indicate_connection is not None:
-            raise ValueError("In progress")
         if not connection.is_connected():
             raise ValueError("Not connected")
+        conn_handle = connection._conn_handle
+        if conn_handle in self._indications:
+            raise ValueError("In progress")
 
-        self._indicate_connection = connection
-        self._indicate_status = None
+        pending = [asyncio.ThreadSafeFlag(), None]
+        self._indications[conn_handle] = pending
 
         try:
             with connection.timeout(timeout_ms):
-                ble.gatts_indicate(connection._conn_handle, self._value_handle, data)
-                await self._indicate_event.wait()
-                if self._indicate_status != 0:
-                    raise GattError(self._indicate_status)
+                ble.gatts_indicate(conn_handle, self._value_handle, data)
+                await pending[0].wait()
+                if pending[1] != 0:
+                    raise GattError(pending[1])
         finally:
-            self._indicate_connection = None
+            del self._indications[conn_handle]
 
     def _indicate_done(conn_handle, value_handle, status):
         if characteristic := _registered_characteristics.get(value_handle, None):
-            if connection := DeviceConnection._connected.get(conn_handle, None):
-                if not characteristic._indicate_connection:
-                    # Timeout.
-                    return
-                # See TODO in __init__ to support multiple concurrent indications.
-                assert connection == characteristic._indicate_connection
-                characteristic._indicate_status = status
-                characteristic._indicate_event.set()
+            if pending := characteristic._indications.get(conn_handle, None):
+                pending[1] = status
+                pending[0].set()
+            # Otherwise it timed out.
 
 
 class BufferedCharacteristic(Characteristic):
@@ -0,0 +1,129 @@
+# ble_link.py – Link settings, connected hosts and a throughput self-test
+# A CSV frame is ~4.6 kB, but at the default ATT MTU of 23 a notification
+# carries only 20 bytes, so the firmware asks for the largest MTU on every
+# connection and sizes its chunks to what was agreed.
+#
+# MicroPython's bluetooth module gives a peripheral no call to request a
+# connection interval, data length extension or the 2M PHY: the central
+# chooses them (NimBLE on the ESP32 accepts DLE and 2M whenever the central
+# offers them). What the link achieves with the central's choice is measured
+# by the self-test instead: "selftest[,<seconds>]" notifies filler lines
+# ('#fill,...', exactly one chunk each) for each of TEST_SETS and reports
+# '#throughput,<chunk>,<pacing_ms>,<bytes>,<ms>,<refused>' per set, where
+# refused counts notifications the controller's full queue turned away. The
+# host compares the bytes it received with the bytes sent.
+
+import time
+import uasyncio as asyncio
+import aioble
+
+MAX_MTU = 517  # largest ATT MTU, 512 bytes of notification payload
+ATT_HEADER = 3
+DEFAULT_PAYLOAD = 20  # at the default MTU of 23
+
+# (chunk bytes, pause ms) per self-test set; chunk None = the MTU's payload
+TEST_SETS = ((DEFAULT_PAYLOAD, 50), (None, 50), (None, 20), (None, 5), (None, 0))
+
+
+class BleLink:
+    def __init__(self, chunk_size=200, pacing_ms=50, mtu=MAX_MTU):
+        self.chunk_size = chunk_size  # upper bound, see LinkClient.chunk()
+        self.pacing_ms = pacing_ms
+        self.mtu = mtu
+        self.test_seconds = 0  # a self-test was asked for
+        aioble.config(mtu=mtu)
+
+    def register(self, commands):
+        commands.register("chunk", self.set_chunk_size)
+        commands.register("pace", self.set_pacing)
+        commands.register("selftest", self.request_test)
+
+    def set_chunk_size(self, size):
+        size = int(size)
+        if not DEFAULT_PAYLOAD <= size <= MAX_MTU - ATT_HEADER:
+            raise ValueError("chunk size out of range")
+        self.chunk_size = size
+
+    def set_pacing(self, ms):
+        ms = int(ms)
+        if not 0 <= ms <= 1000:
+            raise ValueError("pacing out of range")
+        self.pacing_ms = ms
+
+    def request_test(self, seconds=2):
+        seconds = float(seconds)
+        if not 0 < seconds <= 30:
+            raise ValueError("test length out of range")
+        self.test_seconds = seconds
+
+    async def self_test(self, characteristic, client):
+        """Run the requested self-test on client; its stream pauses meanwhile."""
+        connection, payload = client.connection, client.payload
+        duration_ms = int(self.test_seconds * 1000)
+        for chunk, pacing_ms in TEST_SETS:
+            chunk = min(chunk or payload, payload)
+            fill = bytearray(b"#fill," + b"." * (chunk - 7) + b"\n")
+            sent = refused = 0
+            start = time.ticks_ms()
+            while time.ticks_diff(time.ticks_ms(), start) < duration_ms:
+                if not connection.is_connected():
+                    return
+                try:
+                    characteristic.notify(connection, fill)
+                    sent += chunk
+                except OSError:  # ENOMEM: the controller's queue is full
+                    refused += 1
+                await asyncio.sleep_ms(pacing_ms)
+            elapsed = time.ticks_diff(time.ticks_ms(), start)
+            await asyncio.sleep_ms(200)  # let the queue drain before the report
+            report = "#throughput,{},{},{},{},{}\n".format(chunk, pacing_ms, sent, elapsed, refused)
+            report = report.encode()
+            k = 0
+            while k < len(report) and connection.is_connected():
+                try:
+                    characteristic.notify(connection, report[k:k + chunk])
+                    k += chunk
+                except OSError:
+                    pass  # still draining, try again
+                await asyncio.sleep_ms(20)
+
+
+class LinkClient:
+    """One connected host. Each gets its own notification size (MTUs differ
+    between centrals) and its own backpressure, so a slow host only slows
+    the fan-out down while it is waited for."""
+
+    def __init__(self, link, connection):
+        self.link = link
+        self.connection = connection
+        self.payload = DEFAULT_PAYLOAD
+        self.bytes_per_s = 0  # of the last notify_stream
+
+    async def negotiate(self):
+        """Ask for the largest MTU unless the central already exchanged one;
+        returns the notification payload size."""
+        connection = self.connection
+        if not connection.mtu:
+            try:
+                await connection.exchange_mtu(self.link.mtu)
+            except (asyncio.TimeoutError, OSError):
+                pass  # the central keeps the default
+        self.payload = (connection.mtu or DEFAULT_PAYLOAD + ATT_HEADER) - ATT_HEADER
+        return self.payload
+
+    def chunk(self):
+        """Bytes per notification: longer ones would be cut to the payload."""
+        return min(self.link.chunk_size, self.payload)
+
+    async def send(self, characteristic, data, pause_ms=None):
+        """Notify data in chunks, as fast as the controller takes them or
+        pause_ms (default: the link's pacing) apart."""
+        if pause_ms is None:
+            pause_ms = self.link.pacing_ms
+        chunk_size = self.chunk()
+        if not pause_ms:
+            self.bytes_per_s = await characteristic.notify_stream(self.connection, data, chunk_size)
+            return
+        for start in range(0, len(data), chunk_size):
+            characteristic.notify(self.connection, data[start:start + chunk_size])
+            await asyncio.sleep_ms(pause_ms)
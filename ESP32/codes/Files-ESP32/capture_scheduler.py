@@ -0,0 +1,46 @@
+# capture_scheduler.py – Deadline-based pacing for the capture loop
+# Sleeps until the next subpage is due instead of a fixed delay after the
+# work, re-anchors on the sensor's actual data-ready edge so the ESP32 clock
+# cannot drift against it, and skips deadlines the loop fell behind on (the
+# sensor only holds the latest subpage, so being late coalesces naturally).
+
+import time
+
+
+class FrameScheduler:
+    def __init__(self, period_ms, guard_ms=2):
+        self.period_ms = period_ms
+        self.guard_ms = guard_ms  # wake this early to catch the ready edge
+        self.deadline = time.ticks_ms()
+        self.cycle_start = self.deadline
+
+        # Timing of the last cycle, for '#timing' reports
+        self.cycle_ms = 0  # between the last two captures
+        self.busy_ms = 0  # capture, format and send
+        self.slack_ms = 0  # slept waiting for the deadline
+        self.skipped = 0  # subpages the sensor overwrote before we read them
+
+    def wait(self):
+        """Sleep until just before the next subpage is due."""
+        slack = time.ticks_diff(self.deadline, time.ticks_ms()) - self.guard_ms
+        if slack > 0:
+            time.sleep_ms(slack)
+        self.slack_ms = max(slack, 0)
+
+    def captured(self, ready_ms):
+        """A subpage was read; ready_ms is when the successful poll started.
+        The next deadline is one period after it."""
+        self.cycle_ms = time.ticks_diff(ready_ms, self.cycle_start)
+        self.cycle_start = ready_ms
+        self.deadline = time.ticks_add(ready_ms, self.period_ms)
+
+    def finished(self):
+        """The subpage was formatted and sent. If that overran whole periods,
+        count the subpages lost and move the deadline past them."""
+        now = time.ticks_ms()
+        self.busy_ms = time.ticks_diff(now, self.cycle_start)
+        late = time.ticks_diff(now, self.deadline)
+        if late >= self.period_ms:
+            missed = late // self.period_ms
+            self.skipped += missed
+            self.deadline = time.ticks_add(self.deadline, missed * self.period_ms)
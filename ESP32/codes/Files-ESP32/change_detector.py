@@ -0,0 +1,105 @@
+# change_detector.py – Send frames only when the scene changes
+# Keeps a per-pixel model of the scene (an integer EMA of the frames in
+# centi-degrees, so sensor noise alone does not trigger a send) and, as the
+# reference, the model as it was when each pixel was last sent. The model
+# only decides whether a pixel changed; what is sent are the measured values,
+# so the host never lags behind the smoothing. Each frame is then one of:
+#   NONE      no pixel's model moved more than the threshold from the reference
+#   DELTA     a few pixels did; only they are sent ('#delta' line)
+#   KEYFRAME  many pixels did, the first frame, or the heartbeat is due; the
+#             whole frame is sent as a normal CSV line
+# so an empty room costs one keyframe per heartbeat instead of 4 frames/s.
+
+import array, time
+
+NONE = 0
+DELTA = 1
+KEYFRAME = 2
+
+
+class ChangeDetector:
+    def __init__(self, threshold=0.5, keyframe_every_ms=10_000, max_delta_fraction=0.25, smoothing=1):
+        self.threshold = int(threshold * 100)  # centi-degrees
+        self.keyframe_every_ms = keyframe_every_ms
+        # A delta pixel costs about twice a CSV value, so beyond this share
+        # of changed pixels a keyframe is smaller (and fits FrameEncoder)
+        self.max_delta_fraction = min(max_delta_fraction, 0.5)
+        self.smoothing = smoothing  # model += (frame - model) >> smoothing
+
+        self.model = array.array('h', bytes(2 * 768))
+        self.reference = array.array('h', bytes(2 * 768))
+        self.changed = array.array('H', bytes(2 * 768))  # pixels of the last DELTA
+        self.count = 0
+        self.last_keyframe = None
+        self._pixels = -1
+        self._max_delta = 0
+
+        self.keyframes = 0
+        self.deltas = 0
+        self.idle = 0
+
+    def reset(self):
+        """Send a keyframe next, e.g. when a new host connected."""
+        self.last_keyframe = None
+
+    def update(self, centi, pixels):
+        """Fold a quantized frame (FrameEncoder.quantize) into the model and
+        decide what to send for pixels. KEYFRAME and DELTA values are the
+        measured ones in centi; DELTA pixels are self.changed[:self.count]."""
+        model, reference, changed = self.model, self.reference, self.changed
+        n = len(pixels)
+        if n != self._pixels:
+            self._pixels = n
+            self._max_delta = int(n * self.max_delta_fraction)
+        now = time.ticks_ms()
+
+        if self.last_keyframe is None:
+            # Nothing to smooth against yet
+            for k in range(n):
+                p = pixels[k]
+                model[p] = centi[p]
+            return self._keyframe(pixels, now)
+
+        shift, threshold = self.smoothing, self.threshold
+        count = 0
+        for k in range(n):
+            p = pixels[k]
+            m = model[p]
+            m += (centi[p] - m) >> shift
+            model[p] = m
+            d = m - reference[p]
+            if d > threshold or d < -threshold:
+                changed[count] = p
+                count += 1
+        self.count = count
+
+        if (count > self._max_delta
+                or time.ticks_diff(now, self.last_keyframe) >= self.keyframe_every_ms):
+            return self._keyframe(pixels, now)
+        if count == 0:
+            self.idle += 1
+            return NONE
+        for k in range(count):
+            p = changed[k]
+            reference[p] = model[p]
+        self.deltas += 1
+        return DELTA
+
+    def encode(self, encoder, centi, pixels, tag=""):
+        """Update with a quantized frame and return the line to send for it
+        via encoder (a frame_encoding.FrameEncoder), or None."""
+        kind = self.update(centi, pixels)
+        if kind == KEYFRAME:
+            return encoder.csv_centi(centi, pixels, tag)
+        if kind == DELTA:
+            return encoder.delta(centi, self.changed, self.count, tag)
+        return None
+
+    def _keyframe(self, pixels, now):
+        model, reference = self.model, self.reference
+        for k in range(len(pixels)):
+            p = pixels[k]
+            reference[p] = model[p]
+        self.last_keyframe = now
+        self.keyframes += 1
+        return KEYFRAME
@@ -0,0 +1,74 @@
+# command_channel.py – Commands from the host
+# The host writes '\n'-terminated lines "<name>[,<arg>,...]", over USB to the
+# REPL's stdin or over BLE to the writable characteristic. Every command is
+# answered with '#ok,<name>' or '#error,<name>,<reason>' on the stream.
+#   frames,<seconds>   in count mode, also stream frames for a while (0 stops)
+#   rate,<hz>          sensor refresh rate, 0.5 to 64 in powers of two
+#   encoding,csv | encoding,delta[,<degrees>] | encoding,pack[,<step>]
+#                      frame lines (compensated mode), see FrameOutput
+#   roi,full | roi,<192 hex digits>[,<sensor>]   region of interest, as '#roi'
+#   chunk,<bytes>      main_ble.py: notification size
+#   pace,<ms>          main_ble.py: pause after each notification
+#   selftest[,<seconds>]   main_ble.py: measure throughput, see ble_link.py
+# stream_config.py implements rate, encoding and roi.
+
+import sys
+
+try:
+    import select
+except ImportError:
+    select = None
+
+MAX_LINE = 128
+
+
+class CommandChannel:
+    def __init__(self):
+        self.handlers = {}
+        self.replies = []  # lines to send back, drained by the main loop
+        self._line = bytearray()
+        self._poll = None
+        self._ready = None
+
+    def register(self, name, handler):
+        """handler(*args) runs for '<name>,<args>'; it raises ValueError (or
+        TypeError for a wrong argument count) to reject the command."""
+        self.handlers[name] = handler
+
+    def execute(self, line):
+        fields = line.strip().split(",")
+        name = fields[0]
+        handler = self.handlers.get(name)
+        if handler is None:
+            return "#error,{},unknown command\n".format(name)
+        try:
+            handler(*fields[1:])
+        except (ValueError, TypeError) as e:
+            return "#error,{},{}\n".format(name, str(e).replace(",", ";"))
+        return "#ok,{}\n".format(name)
+
+    def feed(self, data):
+        """Add received bytes; complete lines are executed right away."""
+        for byte in data:
+            if byte == 10:  # '\n'
+                if self._line:
+                    self.replies.append(self.execute(self._line.decode()))
+                self._line = bytearray()
+            elif byte != 13 and len(self._line) < MAX_LINE:
+                self._line.append(byte)
+
+    def poll_stdin(self):
+        """Read whatever the host typed over USB without blocking."""
+        if select is None:
+            return
+        if self._poll is None:
+            self._poll = select.poll()
+            self._poll.register(sys.stdin, select.POLLIN)
+            # MicroPython's ipoll does not allocate a result list per call
+            self._ready = getattr(self._poll, "ipoll", self._poll.poll)
+        while True:
+            for _ in self._ready(0):
+                break
+            else:
+                return
+            self.feed(sys.stdin.buffer.read(1))
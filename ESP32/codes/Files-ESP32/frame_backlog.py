@@ -0,0 +1,107 @@
+# frame_backlog.py – Keeps recording while no host is connected
+# On the SPIRAM firmware (ESP32_GENERIC-SPIRAM) the MicroPython heap lives in
+# PSRAM, so one large bytearray allocated at startup holds minutes of frames.
+# Frames captured during a BLE disconnect are compressed with thermal_codec
+# ('#pack' lines; raw subpages stay '#raw' lines) into that ring, the oldest
+# dropped first when it is full, and sent ahead of the live stream on
+# reconnect. Each record is preceded on the wire by '#backlog,<age_ms>,
+# <records left>' so the host can timestamp it.
+#
+# The GC scans the ring like any other block, so collections take longer
+# with a bigger ring; watch max_gc_ms in the '#heap' reports.
+#
+# Record layout: 2-byte length n, 4-byte capture tick, n - 4 bytes of line.
+
+import time
+import frame_encoding, thermal_codec
+
+BACKLOG_KEYFRAME_EVERY = 16  # a dropped record costs at most this many frames
+
+
+class FrameBacklog:
+    def __init__(self, cams, raw=False, size_bytes=1024 * 1024, keyframe_every=BACKLOG_KEYFRAME_EVERY):
+        self.cams = cams
+        self.raw = raw
+        self.tags = [""] if len(cams) == 1 else ["{}:".format(i) for i in range(len(cams))]
+        self.ring = bytearray(size_bytes)  # MemoryError without PSRAM
+        self.ring_view = memoryview(self.ring)
+        self.encoder = frame_encoding.FrameEncoder(raw=raw)
+        self.packers = None if raw else [thermal_codec.Encoder(keyframe_every=keyframe_every) for _ in cams]
+        self.out = bytearray(len(self.encoder.buf))
+        self.out_view = memoryview(self.out)
+        self.header = bytearray(6)
+
+        self.head = 0  # next write position
+        self.tail = 0  # oldest record
+        self.used = 0
+        self.records = 0
+        self.recorded = 0
+        self.dropped = 0
+
+    def _write(self, pos, data):
+        """Copy data into the ring at pos, wrapping at the end."""
+        size = len(self.ring)
+        first = min(len(data), size - pos)
+        self.ring[pos:pos + first] = data[:first]
+        if first < len(data):
+            self.ring[0:len(data) - first] = data[first:]
+        return (pos + len(data)) % size
+
+    def _read(self, pos, out, n):
+        size = len(self.ring)
+        first = min(n, size - pos)
+        out[0:first] = self.ring_view[pos:pos + first]
+        if first < n:
+            out[first:n] = self.ring_view[0:n - first]
+        return (pos + n) % size
+
+    def _drop_oldest(self):
+        ring, size = self.ring, len(self.ring)
+        n = ring[self.tail] | ring[(self.tail + 1) % size] << 8
+        self.tail = (self.tail + 2 + n) % size
+        self.used -= 2 + n
+        self.records -= 1
+        self.dropped += 1
+
+    def record(self, i, frame):
+        """Encode sensor i's frame and store it with the current tick."""
+        if self.raw:
+            line = self.encoder.raw(frame, self.tags[i])
+        else:
+            centi = self.encoder.quantize(frame)
+            message = self.packers[i].encode(centi, self.cams[i].roi)
+            line = self.encoder.packed(message, self.tags[i])
+
+        n = len(line) + 4
+        while self.used + 2 + n > len(self.ring):
+            self._drop_oldest()
+        header, tick = self.header, time.ticks_ms()
+        header[0] = n & 0xFF
+        header[1] = n >> 8
+        for k in range(4):
+            header[2 + k] = (tick >> (8 * k)) & 0xFF
+        self.head = self._write(self.head, header)
+        self.head = self._write(self.head, line)
+        self.used += 2 + n
+        self.records += 1
+        self.recorded += 1
+
+    def pop(self):
+        """Remove the oldest record; returns (age_ms, line view) or None.
+        The view is valid until the next pop()."""
+        if not self.records:
+            return None
+        header = self.header
+        pos = self._read(self.tail, header, 6)
+        n = header[0] | header[1] << 8
+        tick = header[2] | header[3] << 8 | header[4] << 16 | header[5] << 24
+        self.tail = self._read(pos, self.out, n - 4)
+        self.used -= 2 + n
+        self.records -= 1
+        return time.ticks_diff(time.ticks_ms(), tick), self.out_view[:n - 4]
+
+    def start(self):
+        """A recording starts: its first frames are keyframes, since the host
+        decoded other '#pack' lines since the last one."""
+        for packer in self.packers or ():
+            packer.reset()
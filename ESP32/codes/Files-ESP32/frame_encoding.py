@@ -0,0 +1,239 @@
+# frame_encoding.py – Line formats shared by main_usb.py and main_ble.py
+# Every message is one '\n'-terminated line, optionally tagged "<sensor>:"
+# when several sensors share the ESP32 (decoded by thermal_stream.py):
+#   25.31,25.40,...         temperatures of the ROI pixels (768 without ROI)
+#   #roi,<hex>              ROI as a 96-byte pixel bitmap
+#   #serial,<w0>,<w1>,<w2>  sensor serial number words (hex)
+#   #ee,<base64>            EEPROM dump, 832 little-endian words
+#   #raw,<base64>           raw subpage, 834 little-endian words
+#   #pack,<base64>          frame as a thermal_codec.py message
+#   #delta,<p>,<t>,<p>,<t>  only pixels p changed, to temperatures t, since
+#                           the last frame (change_detector.py)
+#   #timing,<cycle_ms>,<busy_ms>,<slack_ms>,<skipped>  capture loop timing
+#   #heap,<free>,<largest_free>,<collections>,<last_gc_ms>,<max_gc_ms>,<memory_errors>
+#                           heap state (heap_monitor.py)
+#   #stats,<name>=<value>,...  performance counters (telemetry.py)
+#
+# Per-frame lines go through FrameEncoder, which writes into one buffer
+# allocated at startup; the string helpers are for headers built once.
+
+import array, binascii
+
+try:
+    import micropython
+    _viper = hasattr(micropython, "viper")
+except ImportError:
+    _viper = False
+
+_B64_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+
+
+def _b64(buf):
+    return binascii.b2a_base64(buf, newline=False).decode()
+
+
+def roi_line(cam, tag=""):
+    # Imported here: mlx90640 needs machine, and nothing else in this module
+    # does, so the module also loads on CPython
+    import mlx90640
+    return tag + "#roi," + mlx90640.roi_mask_hex(cam.roi) + "\n"
+
+
+def raw_handshake_lines(cam, tag=""):
+    """Serial number and EEPROM dump a host needs before it can calibrate
+    '#raw' subpages from this sensor."""
+    serial = "{}#serial,{:04x},{:04x},{:04x}\n".format(tag, *cam.serial_number)
+    ee_words = array.array('H', cam.ee_data[:832])
+    return serial + tag + "#ee," + _b64(ee_words) + "\n"
+
+
+if _viper:
+    @micropython.viper
+    def quantize_centi(src, dst, n: int):
+        """Round n floats of src to centi-degrees into the 'h' array dst.
+        Works on the float bits, so no float objects are boxed per pixel."""
+        s = ptr32(src)
+        d = ptr16(dst)
+        for i in range(n):
+            bits = s[i]
+            shift = 21 - (((bits >> 23) & 0xFF) - 127)
+            value = ((bits & 0x7FFFFF) | 0x800000) * 25  # mantissa * 100 / 4
+            if shift > 30:
+                value = 0
+            elif shift > 0:
+                value = (value + (1 << (shift - 1))) >> shift
+            else:
+                value = 32767
+            if value > 32767:
+                value = 32767
+            if (bits >> 31) & 1:
+                value = 0 - value
+            d[i] = value
+
+    @micropython.viper
+    def _b64_into(src, nbytes: int, dst, pos: int) -> int:
+        """Base64 of the first nbytes of src into dst at pos; returns the new
+        position."""
+        s = ptr8(src)
+        d = ptr8(dst)
+        a = ptr8(_B64_ALPHABET)
+        i = 0
+        while i + 2 < nbytes:
+            v = (s[i] << 16) | (s[i + 1] << 8) | s[i + 2]
+            d[pos] = a[v >> 18]
+            d[pos + 1] = a[(v >> 12) & 0x3F]
+            d[pos + 2] = a[(v >> 6) & 0x3F]
+            d[pos + 3] = a[v & 0x3F]
+            i += 3
+            pos += 4
+        if i < nbytes:
+            v = s[i] << 16
+            if i + 1 < nbytes:
+                v |= s[i + 1] << 8
+            d[pos] = a[v >> 18]
+            d[pos + 1] = a[(v >> 12) & 0x3F]
+            d[pos + 2] = a[(v >> 6) & 0x3F] if i + 1 < nbytes else 61
+            d[pos + 3] = 61
+            pos += 4
+        return pos
+else:
+    # CPython (tests, host tools): same results without the native emitter
+    def quantize_centi(src, dst, n):
+        # Halves round away from zero, as the viper version does on the
+        # magnitude (round() would round them to even)
+        for i in range(n):
+            x = src[i]
+            value = min(32767, int(abs(x) * 100 + 0.5))
+            dst[i] = -value if x < 0 else value
+
+    def _b64_into(src, nbytes, dst, pos):
+        encoded = binascii.b2a_base64(bytes(memoryview(src).cast("B")[:nbytes]), newline=False)
+        dst[pos:pos + len(encoded)] = encoded
+        return pos + len(encoded)
+
+
+class FrameEncoder:
+    """
+    Encodes frame, raw and timing lines into a buffer allocated once, so the
+    steady-state send loop does not allocate (and fragment) the heap. Each
+    method returns a memoryview of the line, valid until the next call.
+    """
+
+    def __init__(self, raw=False):
+        # '-xxx.xx,' per pixel, or base64 of 834 words, plus tag and prefix
+        size = 4 * (2 * 834 + 2) // 3 + 16 if raw else 8 * 768 + 16
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.centi = array.array('h', bytes(2 * 768))
+        self.tags = {}
+
+    def _tag(self, tag, prefix):
+        """Write tag and prefix at the start of the buffer."""
+        key = tag + prefix
+        encoded = self.tags.get(key)
+        if encoded is None:
+            encoded = self.tags[key] = key.encode()
+        self.buf[0:len(encoded)] = encoded
+        return len(encoded)
+
+    def _put_int(self, pos, value, end):
+        """Decimal digits of value and the end byte (',' or '\\n') at pos;
+        returns the new position."""
+        buf = self.buf
+        if value < 0:
+            buf[pos] = 45  # '-'
+            pos += 1
+            value = -value
+        digits = 1
+        while digits <= value // 10:
+            digits *= 10
+        while digits:
+            buf[pos] = 48 + (value // digits) % 10
+            pos += 1
+            digits //= 10
+        buf[pos] = end
+        return pos + 1
+
+    def quantize(self, frame):
+        """Round a float frame to centi-degrees into self.centi."""
+        quantize_centi(frame, self.centi, 768)
+        return self.centi
+
+    def csv(self, frame, pixels, tag=""):
+        """Temperatures of pixels (an index array, e.g. cam.roi) with two
+        decimals, as one CSV line."""
+        return self.csv_centi(self.quantize(frame), pixels, tag)
+
+    def csv_centi(self, centi, pixels, tag=""):
+        """CSV line of pixels from a centi-degree 'h' array."""
+        buf = self.buf
+        n = self._tag(tag, "")
+        for k in range(len(pixels)):
+            v = centi[pixels[k]]
+            if v < 0:
+                buf[n] = 45  # '-'
+                n += 1
+                v = -v
+            whole = v // 100
+            if whole >= 100:
+                buf[n] = 48 + whole // 100
+                n += 1
+            if whole >= 10:
+                buf[n] = 48 + (whole // 10) % 10
+                n += 1
+            frac = v % 100
+            buf[n] = 48 + whole % 10
+            buf[n + 1] = 46  # '.'
+            buf[n + 2] = 48 + frac // 10
+            buf[n + 3] = 48 + frac % 10
+            buf[n + 4] = 44  # ','
+            n += 5
+        buf[n - 1] = 10  # '\n' replaces the last ','
+        return self.view[:n]
+
+    def _put_centi(self, pos, value, end):
+        """value / 100 with two decimals and the end byte at pos."""
+        buf = self.buf
+        if value < 0:
+            buf[pos] = 45  # '-'
+            pos += 1
+            value = -value
+        pos = self._put_int(pos, value // 100, 46)  # '.'
+        buf[pos] = 48 + (value % 100) // 10
+        buf[pos + 1] = 48 + value % 10
+        buf[pos + 2] = end
+        return pos + 3
+
+    def delta(self, centi, changed, count, tag=""):
+        """'#delta' line with the first count pixels of changed and their
+        values in centi (see change_detector.py)."""
+        n = self._tag(tag, "#delta,")
+        for k in range(count):
+            p = changed[k]
+            n = self._put_int(n, p, 44)
+            n = self._put_centi(n, centi[p], 44)
+        self.buf[n - 1] = 10
+        return self.view[:n]
+
+    def packed(self, message, tag=""):
+        """'#pack' line of a thermal_codec.Encoder message."""
+        n = self._tag(tag, "#pack,")
+        n = _b64_into(message, len(message), self.buf, n)
+        self.buf[n] = 10
+        return self.view[:n + 1]
+
+    def raw(self, rawbuf, tag=""):
+        """One raw subpage as read by MLX90640.get_raw_frame, '#raw' line."""
+        n = self._tag(tag, "#raw,")
+        n = _b64_into(rawbuf, 2 * 834, self.buf, n)
+        self.buf[n] = 10
+        return self.view[:n + 1]
+
+    def timing(self, scheduler):
+        """'#timing' line of the scheduler's last cycle."""
+        n = self._tag("", "#timing,")
+        n = self._put_int(n, scheduler.cycle_ms, 44)
+        n = self._put_int(n, scheduler.busy_ms, 44)
+        n = self._put_int(n, scheduler.slack_ms, 44)
+        n = self._put_int(n, scheduler.skipped, 10)
+        return self.view[:n]
@@ -0,0 +1,147 @@
+# frame_output.py – What main_usb.py and main_ble.py send for each frame
+# Ties the encoders together per sensor: header lines for late listeners,
+# raw subpages, '#pack' or change-detected frames, and in count mode the
+# '#count' events of occupancy.py with frames only while the host asked for
+# them. Frame lines are views into FrameEncoder's buffer (see
+# frame_encoding.py), so nothing here allocates per frame.
+
+import time
+import frame_encoding, thermal_codec
+from change_detector import ChangeDetector
+from occupancy import BlobCounter
+
+
+class FrameOutput:
+    def __init__(self, cams, raw=False, header_every=20, change_threshold=None,
+                 keyframe_every_ms=10_000, packed=False, pack_step=1,
+                 pack_keyframe_every=32, count_people=False):
+        self.cams = cams
+        self.raw = raw
+        self.tags = [""] if len(cams) == 1 else ["{}:".format(i) for i in range(len(cams))]
+        self.header_every = header_every
+        self.keyframe_every_ms = keyframe_every_ms
+        self.pack_keyframe_every = pack_keyframe_every
+        self.encoder = frame_encoding.FrameEncoder(raw=raw)
+
+        self.packers = self.detectors = self.counters = None
+        self.encoding = "raw"
+        if not raw:
+            if packed:
+                self.set_encoding("pack", pack_step)
+            elif change_threshold is not None:
+                self.set_encoding("delta", change_threshold)
+            else:
+                self.set_encoding("csv")
+            if count_people:
+                self.counters = [BlobCounter() for _ in cams]
+        self.frames_until = None  # count mode: stream frames until this tick
+
+        self.lines = [None] * 3  # filled by encode()
+        self.update_headers()
+        self.reset()
+
+    def update_headers(self):
+        """Build the ROI mask or EEPROM handshake lines once (again after a
+        sensor's ROI changed)."""
+        if self.raw:
+            headers = [frame_encoding.raw_handshake_lines(cam, tag)
+                       for tag, cam in zip(self.tags, self.cams)]
+        else:
+            headers = [None if len(cam.roi) == 768 else frame_encoding.roi_line(cam, tag)
+                       for tag, cam in zip(self.tags, self.cams)]
+        # Views, so BLE can chunk them without copies
+        self.headers = [header and memoryview(header.encode()) for header in headers]
+
+    def set_encoding(self, encoding, value=None):
+        """Switch the frame lines to "csv", "delta" (change detection,
+        value = threshold in degrees) or "pack" (value = quantization step in
+        centi-degrees). Takes effect with a keyframe on the next frame."""
+        if self.raw:
+            raise ValueError("raw mode")
+        if encoding == "csv":
+            packers = detectors = None
+        elif encoding == "delta":
+            threshold = 0.5 if value is None else float(value)
+            if threshold < 0:
+                raise ValueError("negative threshold")
+            packers = None
+            detectors = [ChangeDetector(threshold, self.keyframe_every_ms) for _ in self.cams]
+        elif encoding == "pack":
+            step = 1 if value is None else int(value)
+            if not 1 <= step <= 100:
+                raise ValueError("step out of range")
+            packers = [thermal_codec.Encoder(step=step, keyframe_every=self.pack_keyframe_every)
+                       for _ in self.cams]
+            detectors = None
+        else:
+            raise ValueError("unknown encoding")
+        self.encoding = encoding
+        self.packers, self.detectors = packers, detectors
+
+    def roi_changed(self):
+        """A sensor's ROI changed: announce it again and start every stream
+        over, since deltas and backgrounds refer to the old pixels."""
+        self.update_headers()
+        for counter in self.counters or ():
+            counter.primed = False
+        self.reset()
+
+    def reset(self):
+        """Start over for a new listener: headers and keyframes come first."""
+        self.frame_counts = [0] * len(self.cams)
+        for stream in self.detectors or self.packers or ():
+            stream.reset()
+
+    def stream_frames(self, seconds):
+        """In count mode, also send frames for the next seconds (0 stops)."""
+        seconds = float(seconds)
+        if seconds <= 0:
+            self.frames_until = None
+        else:
+            self.frames_until = time.ticks_add(time.ticks_ms(), int(seconds * 1000))
+
+    def _frames_wanted(self):
+        if self.counters is None:
+            return True
+        if self.frames_until is None:
+            return False
+        if time.ticks_diff(self.frames_until, time.ticks_ms()) <= 0:
+            self.frames_until = None
+            return False
+        return True
+
+    def encode(self, i, frame):
+        """Encode what goes out for sensor i's frame into self.lines and
+        return how many lines that is (possibly 0). Valid until the next
+        call."""
+        lines, encoder = self.lines, self.encoder
+        cam, tag = self.cams[i], self.tags[i]
+        n = 0
+        if self.headers[i] and self.frame_counts[i] % self.header_every == 0:
+            lines[n] = self.headers[i]
+            n += 1
+        self.frame_counts[i] += 1
+
+        if self.raw:
+            lines[n] = encoder.raw(frame, tag)
+            return n + 1
+
+        centi = encoder.quantize(frame)
+        if self.counters:
+            counter = self.counters[i]
+            if counter.update(centi, cam.roi):
+                lines[n] = counter.count_line(tag).encode()  # only on change
+                n += 1
+        if not self._frames_wanted():
+            return n
+
+        if self.packers:
+            line = encoder.packed(self.packers[i].encode(centi, cam.roi), tag)
+        elif self.detectors:
+            line = self.detectors[i].encode(encoder, centi, cam.roi, tag)
+        else:
+            line = encoder.csv_centi(centi, cam.roi, tag)
+        if line:
+            lines[n] = line
+            n += 1
+        return n
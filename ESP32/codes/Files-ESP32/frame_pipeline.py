@@ -0,0 +1,116 @@
+# frame_pipeline.py – Capture thread with double-buffered frame handoff
+# A background thread reads and compensates subpages into one buffer per
+# sensor while the main thread (or asyncio task) encodes and sends the other,
+# so transmit time no longer subtracts from capture time.
+#
+# The handoff is lock-free: per sensor, `_full` is only set by the capture
+# thread when empty and only cleared by the consumer, and `_free` only the
+# other way round, so each slot has a single writer at a time.
+
+import _thread, gc, time
+import mlx90640
+
+CAPTURE_STACK_SIZE = 16 * 1024  # compensation math needs more than the default
+
+
+class FramePipeline:
+    def __init__(self, sensors, scheduler=None):
+        self.sensors = sensors
+        self.scheduler = scheduler
+        count = len(sensors.frames)
+        # The capture thread fills sensors.frames[i]; the spare starts out free
+        if sensors.raw:
+            self._free = [mlx90640.init_raw_array(834) for _ in range(count)]
+        else:
+            self._free = [mlx90640.init_float_array(768) for _ in range(count)]
+        self._full = [None] * count
+        self._next = 0
+        self._changes = []  # run by the capture thread between subpages
+
+        self.running = False
+        self.captured = 0
+        self.dropped = 0  # captured while the consumer still held the spare
+        self.errors = 0  # failed reads (bus noise), capture carries on
+        self.memory_errors = 0
+        self.failure = None  # "Type: message" of the error that stopped capture
+
+    def start(self):
+        self.running = True
+        _thread.stack_size(CAPTURE_STACK_SIZE)
+        _thread.start_new_thread(self._capture_loop, ())
+
+    def apply(self, change):
+        """Run change() on the capture thread before its next subpage, e.g. to
+        write a sensor register without interleaving with its reads."""
+        self._changes.append(change)
+
+    def stop(self):
+        self.running = False
+
+    def _capture_loop(self):
+        sensors, scheduler = self.sensors, self.scheduler
+        while self.running:
+            if scheduler:
+                scheduler.wait()
+            try:
+                while self._changes:
+                    self._changes.pop(0)()
+                ready_ms = time.ticks_ms()
+                i = sensors.poll()
+                if i < 0:
+                    time.sleep_ms(1)
+                    continue
+                if scheduler:
+                    scheduler.captured(ready_ms)
+                self.captured += 1
+                self._publish(i)
+                if scheduler:
+                    scheduler.finished()
+            except MemoryError:
+                # The subpage is lost, but the buffers are preallocated, so
+                # a collection is enough to carry on
+                self.memory_errors += 1
+                gc.collect()
+            except (OSError, RuntimeError):
+                self.errors += 1  # e.g. 'Too many retries' on a noisy bus
+            except Exception as e:
+                # A bug, not bus noise: stop capturing and leave the error for
+                # the main loop to report instead of counting it forever
+                self.failure = "{}: {}".format(type(e).__name__, e)
+                self.running = False
+                raise
+
+    def _publish(self, i):
+        frames = self.sensors.frames
+        spare = self._free[i]
+        if self._full[i] is not None or spare is None:
+            # Consumer is behind; this frame stays in the capture buffer and
+            # the next subpage updates it in place
+            self.dropped += 1
+            return
+        filled = frames[i]
+        # Both subpages merge in one buffer, so carry the latest frame over
+        spare[:] = filled
+        self._free[i] = None
+        frames[i] = spare
+        self._full[i] = filled
+
+    def failure_line(self):
+        """'#error,capture,<reason>' line once capture has stopped on an error."""
+        return "#error,capture,{}\n".format(self.failure.replace(",", ";"))
+
+    def take(self):
+        """Return (sensor index, frame buffer) of a captured frame, or
+        (-1, None). Hand the buffer back with release() once it is sent."""
+        count = len(self._full)
+        for k in range(count):
+            i = (self._next + k) % count
+            buf = self._full[i]
+            if buf is not None:
+                self._full[i] = None
+                self._next = (i + 1) % count
+                return i, buf
+        return -1, None
+
+    def release(self, i, buf):
+        self._free[i] = buf
@@ -0,0 +1,68 @@
+# heap_monitor.py – Budgeted garbage collection and '#heap' reports
+# With the send path allocation free, garbage only comes from the float math
+# of the compensation. Instead of gc.collect() after every frame (a full mark
+# and sweep each time) the heap is collected between frames once free memory
+# falls below a low-water mark, well before an allocation could fail, and the
+# pauses are timed so they show up in the '#heap' telemetry.
+
+import gc, time
+
+try:
+    import esp32
+except ImportError:
+    esp32 = None
+
+LOW_WATER = 24 * 1024  # bytes free below which the next idle moment collects
+REPORT_EVERY_MS = 5000
+
+
+class HeapMonitor:
+    def __init__(self, low_water=LOW_WATER, report_every_ms=REPORT_EVERY_MS):
+        self.low_water = low_water
+        self.report_every_ms = report_every_ms
+        self.last_report = time.ticks_ms()
+
+        self.collections = 0
+        self.last_gc_ms = 0
+        self.max_gc_ms = 0
+        self.memory_errors = 0
+
+    def collect(self):
+        """Collect now and time the pause."""
+        start = time.ticks_us()
+        gc.collect()
+        pause = time.ticks_diff(time.ticks_us(), start) // 1000
+        self.collections += 1
+        self.last_gc_ms = pause
+        self.max_gc_ms = max(self.max_gc_ms, pause)
+
+    def maybe_collect(self):
+        """Collect if the heap is running low; call between frames."""
+        if gc.mem_free() < self.low_water:
+            self.collect()
+
+    def recover(self):
+        """An allocation failed anyway: collect and carry on rather than
+        resetting the ESP32."""
+        self.memory_errors += 1
+        self.collect()
+
+    def largest_free(self):
+        """Largest free block of the IDF data heap (what the Python heap
+        grows into), or 0 where esp32.idf_heap_info is missing."""
+        if esp32 is None or not hasattr(esp32, "idf_heap_info"):
+            return 0
+        return max((block[2] for block in esp32.idf_heap_info(esp32.HEAP_DATA)), default=0)
+
+    def report_due(self):
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self.last_report) < self.report_every_ms:
+            return False
+        self.last_report = now
+        return True
+
+    def heap_line(self):
+        """'#heap' line; allocates, so only send it when report_due()."""
+        return "#heap,{},{},{},{},{},{}\n".format(
+            gc.mem_free(), self.largest_free(), self.collections,
+            self.last_gc_ms, self.max_gc_ms, self.memory_errors)
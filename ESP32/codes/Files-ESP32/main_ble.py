@@ -1,24 +1,198 @@
 import uasyncio as asyncio
 import aioble
 import bluetooth
-from machine import I2C, Pin, reset
+from machine import I2C, Pin
 import mlx90640
-import array, gc, time
+from frame_output import FrameOutput
+from command_channel import CommandChannel
+from stream_config import StreamConfig
+from ble_link import BleLink, LinkClient
+from capture_scheduler import FrameScheduler
+from frame_pipeline import FramePipeline
+from frame_backlog import FrameBacklog
+from heap_monitor import HeapMonitor
+from telemetry import Telemetry
+import time
 
 SERVICE_UUID = bluetooth.UUID("12345678-1234-5678-1234-56789abcdef0")
 CHARACTERISTIC_UUID = bluetooth.UUID("12345678-1234-5678-1234-56789abcdef1")
+# Read/indicate: telemetry.py counters as little-endian uint32s in FIELDS order
+TELEMETRY_UUID = bluetooth.UUID("12345678-1234-5678-1234-56789abcdef2")
+TELEMETRY_EVERY_MS = 2000
 
 # LED setup on GPIO 2
 LED = Pin(2, Pin.OUT)
 LED.off()
 
-# I2C and MLX90640 setup
-i2c = I2C(0, scl=Pin(22), sda=Pin(21), freq=400_000)
-cam = mlx90640.MLX90640(i2c)
-cam.refresh_rate = mlx90640.RefreshRate.REFRESH_4_HZ
-frame = array.array('f', [0]*768)
+# MLX90640 sensors as (I2C controller, address) and region of interest,
+# see main_usb.py. None streams the full frame.
+SENSORS = ((0, 0x33),)
+I2C_PINS = {0: (22, 21), 1: (25, 26)}  # controller -> (SCL, SDA)
+ROI = None
+ROI_ANNOUNCE_EVERY = 20
+
+# "compensated" or "raw" (EEPROM handshake on connect, then raw subpages)
+MODE = "compensated"
+RAW_HANDSHAKE_EVERY = 100
+if MODE == "raw":
+    REFRESH_RATE = mlx90640.RefreshRate.REFRESH_16_HZ
+else:
+    REFRESH_RATE = mlx90640.RefreshRate.REFRESH_4_HZ
+
+# Only send frames that changed (see main_usb.py); None sends every frame
+CHANGE_THRESHOLD = None
+KEYFRAME_EVERY_MS = 10_000
+
+# Send '#pack' lines of thermal_codec.py instead (see main_usb.py)
+PACKED = False
+PACK_STEP = 1
+PACK_KEYFRAME_EVERY = 32
 
+# Send '#count' events of occupancy.py instead of frames (see main_usb.py);
+# writing "frames,<seconds>" to the characteristic streams frames meanwhile
+COUNT_PEOPLE = False
+
+# Hosts served at once (NimBLE on the ESP32 allows 4 connections). Every
+# frame is encoded once and the same bytes go to each of them.
+MAX_CONNECTIONS = 3
+
+# Keep capturing into a ring buffer while no host is connected and send the
+# backlog ('#backlog' + '#pack' lines) first on reconnect. Needs the SPIRAM
+# firmware: 1 MB holds about 1000 compressed frames, ~4 min at 4 Hz. None
+# disables it.
+BACKLOG_BYTES = 1024 * 1024
+BACKLOG_PACING_MS = 0  # pause between backlog chunks (live frames: PACING_MS)
+
+# Notifications carry CHUNK_SIZE bytes each (at most what the MTU agreed on
+# connect allows, see ble_link.py). With PACING_MS = 0 they go out as fast as
+# the controller takes them (Characteristic.notify_stream backs off while its
+# queue is full), otherwise PACING_MS apart. The host can change both
+# ("chunk,<bytes>", "pace,<ms>") and the refresh rate, encoding and ROI
+# (stream_config.py) to match the link, and measure it with "selftest".
 CHUNK_SIZE = 200
+PACING_MS = 0
+
+# I2C and MLX90640 setup
+buses = {}
+cams = []
+for bus_id, address in SENSORS:
+    if bus_id not in buses:
+        scl, sda = I2C_PINS[bus_id]
+        buses[bus_id] = I2C(bus_id, scl=Pin(scl), sda=Pin(sda), freq=400_000)
+    cam = mlx90640.MLX90640(buses[bus_id], address)
+    cam.refresh_rate = REFRESH_RATE
+    cam.roi = ROI
+    cams.append(cam)
+
+sensors = mlx90640.SensorGroup(cams, raw=MODE == "raw")
+output = FrameOutput(
+    cams, raw=sensors.raw,
+    header_every=RAW_HANDSHAKE_EVERY if sensors.raw else ROI_ANNOUNCE_EVERY,
+    change_threshold=CHANGE_THRESHOLD, keyframe_every_ms=KEYFRAME_EVERY_MS,
+    packed=PACKED, pack_step=PACK_STEP, pack_keyframe_every=PACK_KEYFRAME_EVERY,
+    count_people=COUNT_PEOPLE,
+)
+commands = CommandChannel()
+commands.register("frames", output.stream_frames)
+heap = HeapMonitor()
+backlog = None
+if BACKLOG_BYTES:
+    try:
+        backlog = FrameBacklog(cams, raw=sensors.raw, size_bytes=BACKLOG_BYTES)
+    except MemoryError:
+        print("No room for the backlog (not a SPIRAM build?), not recording offline")
+
+# Capture runs on its own thread (paced to the refresh rate) into double
+# buffers, so sending over BLE no longer holds up reading the sensors
+period_ms = int(1000 / mlx90640.refresh_rate_hz(REFRESH_RATE) / len(cams))
+pipeline = FramePipeline(sensors, FrameScheduler(period_ms))
+telemetry = Telemetry(cams, pipeline, heap)
+StreamConfig(cams, pipeline, output, backlog).register(commands)
+
+link = BleLink(CHUNK_SIZE, PACING_MS)
+link.register(commands)
+clients = []  # LinkClient per connected host, in connection order
+
+async def broadcast(characteristic, data, pause_ms=None):
+    # Fan the same bytes out to every host at once, each at its own pace.
+    # Hosts that dropped (or stalled) are removed; the others carry on.
+    targets = clients[:]
+    if len(targets) == 1:
+        results = [await _send(targets[0], characteristic, data, pause_ms)]
+    else:
+        results = await asyncio.gather(
+            *(_send(client, characteristic, data, pause_ms) for client in targets))
+    for client, result in zip(targets, results):
+        if result is not None:
+            if client in clients:
+                clients.remove(client)
+            print("Device {}: {}".format(result, client.connection.device))
+            if client.connection.is_connected():
+                await client.connection.disconnect()
+
+async def _send(client, characteristic, data, pause_ms):
+    # Why this host's stream ended, or None
+    try:
+        await client.send(characteristic, data, pause_ms)
+    except (asyncio.CancelledError, aioble.DeviceDisconnectedError):
+        return "disconnected"
+    except asyncio.TimeoutError:
+        # The controller took nothing for seconds: the link is gone in all
+        # but name, so drop it and let the host reconnect
+        return "stalled"
+    except OSError as e:
+        # notify refused (full queue with pacing on, or the link went down
+        # between checks): drop this host only
+        return "failed ({})".format(e)
+
+async def read_commands(characteristic):
+    # Host commands, one per line, may span several writes
+    while True:
+        _, data = await characteristic.written()
+        commands.feed(data)
+
+async def publish_telemetry(characteristic):
+    # Readable at any time and indicated to every host, which confirms each
+    # record. Indications to different hosts run side by side and beside the
+    # frame stream.
+    while True:
+        characteristic.write(telemetry.pack())
+        await asyncio.gather(*(_indicate(characteristic, client) for client in clients[:]))
+        await asyncio.sleep_ms(TELEMETRY_EVERY_MS)
+
+async def _indicate(characteristic, client):
+    try:
+        await characteristic.indicate(client.connection, timeout_ms=TELEMETRY_EVERY_MS)
+    except (asyncio.TimeoutError, aioble.GattError, aioble.DeviceDisconnectedError, ValueError):
+        pass  # the next record follows soon; the frame stream notices a lost host
+
+async def accept_clients():
+    # Keep advertising while there is room for another host
+    while True:
+        if len(clients) >= MAX_CONNECTIONS:
+            # Hosts that left while nothing was sent to them still count
+            for client in clients[:]:
+                if not client.connection.is_connected():
+                    clients.remove(client)
+            await asyncio.sleep_ms(500)
+            continue
+        print("Advertising BLE thermal camera service as 'ESP32-BLE'...")
+        try:
+            connection = await aioble.advertise(
+                interval_us=100_000,
+                name="ESP32-BLE",
+                services=[SERVICE_UUID]
+            )
+            print("Device connected:", connection.device)
+            client = LinkClient(link, connection)
+            print("Notification payload:", await client.negotiate(), "bytes")
+        except (aioble.DeviceDisconnectedError, ValueError):
+            # Gone again during the MTU exchange: advertise again
+            print("Device disconnected during setup")
+            continue
+        if connection.is_connected():
+            clients.append(client)
+            output.reset()  # the new host gets headers and a keyframe first
 
 def memory_error_blink():
     for _ in range(5):
@@ -30,50 +204,109 @@ def memory_error_blink():
 async def main():
     service = aioble.Service(SERVICE_UUID)
     characteristic = aioble.Characteristic(
-        service, CHARACTERISTIC_UUID, notify=True, read=True
+        service, CHARACTERISTIC_UUID, notify=True, read=True, write=True, capture=True
+    )
+    telemetry_characteristic = aioble.Characteristic(
+        service, TELEMETRY_UUID, notify=True, indicate=True, read=True
     )
     aioble.register_services(service)
+    asyncio.create_task(read_commands(characteristic))
+    asyncio.create_task(publish_telemetry(telemetry_characteristic))
+    asyncio.create_task(accept_clients())
 
+    recording = False
     while True:
-        print("Advertising BLE thermal camera service as 'ESP32-BLE'...")
-        connection = await aioble.advertise(
-            interval_us=100_000,
-            name="ESP32-BLE",
-            services=[SERVICE_UUID]
-        )
+        if pipeline.failure:
+            # The capture thread stopped on a bug; report it rather than idle
+            await broadcast(characteristic, pipeline.failure_line().encode())
+            raise RuntimeError("capture stopped: " + pipeline.failure)
+        try:
+            # Take whichever sensor's frame the capture thread handed over
+            i, frame = pipeline.take()
 
-        print("Device connected:", connection.device)
+            if not clients:
+                # Nobody listening: keep recording into the backlog, if any
+                if backlog and i >= 0:
+                    if not recording:
+                        backlog.start()
+                        recording = True
+                    try:
+                        backlog.record(i, frame)
+                    finally:
+                        pipeline.release(i, frame)
+                    continue
+                if i >= 0:
+                    pipeline.release(i, frame)
+                heap.maybe_collect()
+                await asyncio.sleep_ms(2)
+                continue
 
-        try:
-            while connection.is_connected():
-                # Capture frame with LED indication
-                LED.on()
-                cam.get_frame(frame)
-                LED.off()
+            if recording:
+                recording = False
+                print("Sending", backlog.records, "frames recorded offline")
+                # ROI masks / EEPROM the backlog needs to be decoded
+                for header in output.headers:
+                    if header:
+                        await broadcast(characteristic, header)
 
-                # Prepare CSV data with a newline at the end
-                csv_data = ','.join('{:.2f}'.format(val) for val in frame) + '\n'
-                csv_bytes = csv_data.encode()
+            while commands.replies:
+                await broadcast(characteristic, commands.replies.pop(0).encode())
+            if link.test_seconds:
+                for client in clients[:]:
+                    await link.self_test(characteristic, client)
+                link.test_seconds = 0
 
-                # Send CSV data in chunks
-                for start in range(0, len(csv_bytes), CHUNK_SIZE):
-                    chunk = csv_bytes[start:start+CHUNK_SIZE]
-                    characteristic.write(chunk)
-                    characteristic.notify(connection, chunk)
-                    await asyncio.sleep(0.05)
+            # While the backlog is being sent, new frames queue behind it
+            # so the hosts still get them in order
+            if backlog and backlog.records:
+                if i >= 0:
+                    try:
+                        backlog.record(i, frame)
+                    finally:
+                        pipeline.release(i, frame)
+                age_ms, line = backlog.pop()
+                await broadcast(characteristic,
+                                "#backlog,{},{}\n".format(age_ms, backlog.records).encode(),
+                                BACKLOG_PACING_MS)
+                await broadcast(characteristic, line, BACKLOG_PACING_MS)
+                continue
 
-                print("Sent thermal frame via BLE")
+            if i < 0:
+                heap.maybe_collect()
+                await asyncio.sleep_ms(2)
+                continue
 
-                await asyncio.sleep(0.25)
-                gc.collect()
+            # Encode CSV data of the ROI pixels (or the raw subpage, or a
+            # count event) once for all hosts, announcing the ROI mask or
+            # EEPROM first to a new one. The buffer goes back to the capture
+            # thread as soon as it is encoded.
+            LED.on()
+            start = time.ticks_us()
+            try:
+                count = output.encode(i, frame)
+            finally:
+                pipeline.release(i, frame)
+                LED.off()
+            encoded = time.ticks_us()
 
-        except (asyncio.CancelledError, aioble.DeviceDisconnectedError):
-            print("Device disconnected, restarting advertising.")
+            # Send the lines in chunks
+            for k in range(count):
+                await broadcast(characteristic, output.lines[k])
+            if count:
+                telemetry.frame_sent(cams[i], time.ticks_diff(encoded, start),
+                                     time.ticks_diff(time.ticks_us(), encoded))
+            if heap.report_due():
+                await broadcast(characteristic, heap.heap_line().encode())
 
         except MemoryError:
-            print("Memory error encountered! Blinking LED and resetting ESP32...")
+            print("Memory error encountered! Blinking LED and collecting...")
+            heap.recover()
             memory_error_blink()
-            time.sleep(1)
-            reset()
+            # Start over with fresh connections (and headers) instead of a reset
+            for client in clients[:]:
+                clients.remove(client)
+                if client.connection.is_connected():
+                    await client.connection.disconnect()
 
+pipeline.start()
 asyncio.run(main())
@@ -1,59 +1,161 @@
 # main.py – ESP32 + MLX90640 (Optimized for Memory & Stability)
-# Streams CSV frames at ~4Hz; Visual LED feedback for memory errors.
+# Streams CSV frames (or people counts) at the sensors' refresh rate; Visual LED feedback for memory errors.
 
-import time, sys, gc, array
+import time, sys, gc
 from machine import I2C, Pin
 import mlx90640
+from frame_output import FrameOutput
+from command_channel import CommandChannel
+from stream_config import StreamConfig
+from capture_scheduler import FrameScheduler
+from frame_pipeline import FramePipeline
+from heap_monitor import HeapMonitor
+from telemetry import Telemetry
 
 # LED indicator setup (on GPIO 2)
 LED = Pin(2, Pin.OUT)
 LED.off()
 
-# Optimized I2C frequency for MLX90640
-i2c = I2C(0, scl=Pin(22), sda=Pin(21), freq=400_000)
+# Every MLX90640 on this ESP32 as (I2C controller, address). Sensors at
+# different addresses can share a controller; controller 1 adds a second bus.
+# With more than one sensor each line is tagged with its index, e.g. "1:..."
+SENSORS = ((0, 0x33),)
+I2C_PINS = {0: (22, 21), 1: (25, 26)}  # controller -> (SCL, SDA)
+
+# Region of interest: None streams the full 32x24 frame, otherwise a list of
+# (row, col, height, width) rectangles, e.g. [(0, 8, 24, 16)] for a doorway.
+# Only ROI pixels are computed and sent, preceded by a '#roi' mask line.
+ROI = None
+ROI_ANNOUNCE_EVERY = 20  # frames between '#roi' lines for late listeners
+
+# "compensated" streams temperatures. "raw" sends each sensor's serial and
+# EEPROM dump, then only raw subpages ('#raw' lines) and leaves calibration to
+# the host (thermal_stream.py), so the ESP32 keeps up with faster refresh
+# rates and recordings can be recalibrated later. ROI does not apply to raw.
+MODE = "compensated"
+RAW_HANDSHAKE_EVERY = 100  # raw subpages between handshakes for late listeners
+if MODE == "raw":
+    REFRESH_RATE = mlx90640.RefreshRate.REFRESH_16_HZ
+else:
+    REFRESH_RATE = mlx90640.RefreshRate.REFRESH_4_HZ
+
+# Send a frame only when some pixel moved more than CHANGE_THRESHOLD degrees
+# from what the host has: a few changed pixels go as a '#delta' line, many as
+# a full frame, and a full keyframe goes out at least every KEYFRAME_EVERY_MS.
+# None streams every frame; hosts can switch either way with
+# "encoding,delta[,deg]" / "encoding,csv". Compensated mode only.
+CHANGE_THRESHOLD = None
+KEYFRAME_EVERY_MS = 10_000
+
+# Send frames as '#pack' lines of thermal_codec.py (int16 deltas against the
+# previous frame, varint/run-length packed, a keyframe every PACK_KEYFRAME_EVERY
+# frames) instead of CSV. Takes the place of change detection.
+PACKED = False
+PACK_STEP = 1  # quantization step in centi-degrees
+PACK_KEYFRAME_EVERY = 32
+
+# Count people on the ESP32 (occupancy.py) and send '#count,<people>,<pixels>'
+# events instead of frames. Frames still stream on demand: the host writes
+# "frames,<seconds>" to the serial port (see command_channel.py).
+COUNT_PEOPLE = False
 
-# Use efficient memory structure
-frame = array.array('f', [0]*768)
+TIMING_EVERY = 1  # cycles between '#timing' lines, 0 disables them
+STATS_EVERY_MS = 5000  # between '#stats' lines (telemetry.py), 0 disables them
+
+# Optimized I2C frequency for MLX90640
+buses = {}
+for bus_id, _ in SENSORS:
+    if bus_id not in buses:
+        scl, sda = I2C_PINS[bus_id]
+        buses[bus_id] = I2C(bus_id, scl=Pin(scl), sda=Pin(sda), freq=400_000)
 
 # Delayed camera initialization with memory-safe retries
-cam = None
+cams = []
 time.sleep(2)
 
-while not cam:
+while len(cams) < len(SENSORS):
     try:
-        cam = mlx90640.MLX90640(i2c)
-        cam.refresh_rate = mlx90640.RefreshRate.REFRESH_4_HZ
+        bus_id, address = SENSORS[len(cams)]
+        cam = mlx90640.MLX90640(buses[bus_id], address)
+        cam.refresh_rate = REFRESH_RATE
+        cam.roi = ROI
+        cams.append(cam)
     except MemoryError:
         gc.collect()
         time.sleep(1)
 
-# CSV streaming function
-def send_csv(values):
-    w = sys.stdout.write
-    for i, v in enumerate(values):
-        w("{:.2f}".format(v))
-        w(',' if i < 767 else '\n')
+sensors = mlx90640.SensorGroup(cams, raw=MODE == "raw")
+output = FrameOutput(
+    cams, raw=sensors.raw,
+    header_every=RAW_HANDSHAKE_EVERY if sensors.raw else ROI_ANNOUNCE_EVERY,
+    change_threshold=CHANGE_THRESHOLD, keyframe_every_ms=KEYFRAME_EVERY_MS,
+    packed=PACKED, pack_step=PACK_STEP, pack_keyframe_every=PACK_KEYFRAME_EVERY,
+    count_people=COUNT_PEOPLE,
+)
+commands = CommandChannel()
+commands.register("frames", output.stream_frames)
+
+# Lines are written as bytes; frame lines come from one preallocated buffer
+write = sys.stdout.buffer.write
+heap = HeapMonitor()
 
-# Main data capture loop
+# Every sensor delivers a subpage per refresh period; pace capture to that.
+# Capture runs on its own thread into double buffers while this loop sends.
+period_ms = int(1000 / mlx90640.refresh_rate_hz(REFRESH_RATE) / len(cams))
+scheduler = FrameScheduler(period_ms)
+pipeline = FramePipeline(sensors, scheduler)
+pipeline.start()
+# The host can change refresh rate, encoding and ROI without a reflash
+StreamConfig(cams, pipeline, output).register(commands)
+telemetry = Telemetry(cams, pipeline, heap)
+last_stats = time.ticks_ms()
+cycles = 0
+
+# Main transmit loop: send whichever sensor's frame the capture thread handed
+# over. Nothing in here allocates, so the heap is only collected on a budget.
 while True:
+    i = -1
+    if pipeline.failure:
+        # The capture thread stopped on a bug; report it rather than idle
+        sys.stdout.write(pipeline.failure_line())
+        raise RuntimeError("capture stopped: " + pipeline.failure)
     try:
+        commands.poll_stdin()
+        while commands.replies:
+            sys.stdout.write(commands.replies.pop(0))
+        i, frame = pipeline.take()
+        if i < 0:
+            heap.maybe_collect()
+            time.sleep_ms(2)  # nothing captured yet
+            continue
         LED.on()
-        cam.get_frame(frame)
-        send_csv(frame)
-        gc.collect()
+        start = time.ticks_us()
+        count = output.encode(i, frame)
+        encoded = time.ticks_us()
+        for k in range(count):
+            write(output.lines[k])
+        if count:
+            telemetry.frame_sent(cams[i], time.ticks_diff(encoded, start),
+                                 time.ticks_diff(time.ticks_us(), encoded))
+        cycles += 1
+        if TIMING_EVERY and cycles % TIMING_EVERY == 0:
+            write(output.encoder.timing(scheduler))
+        if heap.report_due():
+            sys.stdout.write(heap.heap_line())
+        if STATS_EVERY_MS and time.ticks_diff(time.ticks_ms(), last_stats) >= STATS_EVERY_MS:
+            last_stats = time.ticks_ms()
+            sys.stdout.write(telemetry.stats_line())
     except MemoryError:
-        # Quickly blink LED to indicate memory error
+        # Quickly blink LED to indicate memory error, then collect and go on
+        heap.recover()
         for _ in range(5):
             LED.on()
             time.sleep(0.1)
             LED.off()
             time.sleep(0.1)
-        from machine import reset
-        reset()
     except Exception:
         pass  # Quietly handle non-critical errors to maintain clean CSV output
     finally:
+        if i >= 0:
+            pipeline.release(i, frame)
         LED.off()
-
-    # Matches the 4 Hz refresh rate for smooth output
-    time.sleep(0.25)
@@ -1,6 +1,6 @@
 import array
 import math
-import struct
+import time
 
 import machine
 import typing
@@ -14,6 +14,43 @@ def init_int_array(size) -> array.array:
     return array.array('i', (0 for _ in range(size)))
 
 
+def init_raw_array(size) -> array.array:
+    return array.array('H', (0 for _ in range(size)))
+
+
+def compile_roi(roi) -> array.array:
+    """Compile a region of interest into a sorted array of pixel indices.
+
+    `roi` is either None (the whole 32x24 field), a list of
+    (row, col, height, width) rectangles, or a 768-element bitmap where
+    truthy entries select the pixel."""
+    if roi is None:
+        return array.array('H', range(768))
+
+    if len(roi) == 768:
+        selected = roi
+    else:
+        selected = bytearray(768)
+        for row, col, height, width in roi:
+            for r in range(max(row, 0), min(row + height, 24)):
+                for c in range(max(col, 0), min(col + width, 32)):
+                    selected[32 * r + c] = 1
+
+    pixels = array.array('H', (p for p in range(768) if selected[p]))
+    if not pixels:
+        raise ValueError('ROI selects no pixels')
+    return pixels
+
+
+def roi_mask_hex(pixels: array.array) -> str:
+    """Pack ROI pixel indices into the 96-byte bitmap (pixel p is bit p & 7 of
+    byte p >> 3) and return it as hex, as announced in '#roi' lines."""
+    mask = bytearray(96)
+    for p in pixels:
+        mask[p >> 3] |= 1 << (p & 7)
+    return ''.join('{:02x}'.format(b) for b in mask)
+
+
 class RefreshRate:
     """Enum-like class for MLX90640's refresh rate."""
     REFRESH_0_5_HZ = 0b000  # 0.5Hz
@@ -26,6 +63,25 @@ class RefreshRate:
     REFRESH_64_HZ = 0b111  # 64Hz
 
 
+class Resolution:
+    """Enum-like class for MLX90640's ADC resolution."""
+    ADC_16_BIT = 0b00
+    ADC_17_BIT = 0b01
+    ADC_18_BIT = 0b10  # factory default
+    ADC_19_BIT = 0b11
+
+
+class ReadingPattern:
+    """Enum-like class for how MLX90640 splits a frame into two subpages."""
+    INTERLEAVED = 0  # alternating rows
+    CHESS = 1  # chess board, factory default
+
+
+def refresh_rate_hz(rate: int) -> float:
+    """Subpages per second produced at a RefreshRate setting."""
+    return 2 ** (rate - 1)
+
+
 class I2CDevice:
     """
     Represents a single I2C device and manages locking the bus and the device
@@ -77,7 +133,6 @@ class I2CDevice:
 class MLX90640:
     """Interface to the MLX90640 temperature sensor."""
 
-    ee_data = init_int_array(834)
     i2c_read_len = 128
     scale_alpha = 0.000001
     mlx90640_deviceid1 = 0x2407
@@ -86,8 +141,19 @@ class MLX90640:
     def __init__(self, i2c_bus: machine.I2C, address: int = 0x33) -> None:
         self.inbuf = bytearray(2 * self.i2c_read_len)
         self.addrbuf = bytearray(2)
+        # Register scratch space, reused so polling does not allocate
+        self.cmdbuf = bytearray(4)
+        self.status_register = [0]
+        self.control_register = [0]
+        # Performance counters for telemetry.py
+        self.i2c_retries = 0  # frame reads repeated because a new subpage arrived
+        self.i2c_failures = 0  # 'Too many retries' errors
+        self.read_us = 0  # last subpage read
+        self.compensate_us = 0  # last temperature calculation
         self.i2c_device = I2CDevice(i2c_bus, address)
         self.mlx90640_frame = init_int_array(834)
+        # Per instance, so several sensors can share one ESP32
+        self.ee_data = init_int_array(834)
         self._i2c_read_words(0x2400, self.ee_data)
 
         # Attributes initialized through extraction methods
@@ -115,7 +181,10 @@ class MLX90640:
         self.il_chess_c = [0, 0, 0]
         self.broken_pixels = set()
         self.outlier_pixels = set()
+        self.bad_pixels = set()
+        self.bad_pixel_neighbours = []
         self.calibration_mode_ee = 0
+        self.roi_pixels = compile_roi(None)
 
         self._extract_parameters()
 
@@ -137,11 +206,54 @@ class MLX90640:
 
     @refresh_rate.setter
     def refresh_rate(self, rate: int) -> None:
+        self._update_control_register(0x0380, (rate & 0x7) << 7)
+
+    @property
+    def resolution(self) -> int:
+        """ADC resolution, see Resolution. Lower resolutions convert faster
+        but are noisier; calibration is corrected against resolution_ee."""
         control_register = [0]
-        value = (rate & 0x7) << 7
         self._i2c_read_words(0x800D, control_register)
-        value |= control_register[0] & 0xFC7F
-        self._i2c_write_word(0x800D, value)
+        return (control_register[0] >> 10) & 0x03
+
+    @resolution.setter
+    def resolution(self, resolution: int) -> None:
+        self._update_control_register(0x0C00, (resolution & 0x3) << 10)
+
+    @property
+    def reading_pattern(self) -> int:
+        """Subpage reading pattern, see ReadingPattern. The factory
+        calibration (calibration_mode_ee) is done in chess mode."""
+        control_register = [0]
+        self._i2c_read_words(0x800D, control_register)
+        return (control_register[0] >> 12) & 0x01
+
+    @reading_pattern.setter
+    def reading_pattern(self, pattern: int) -> None:
+        self._update_control_register(0x1000, (pattern & 0x1) << 12)
+
+    @property
+    def roi(self) -> array.array:
+        """Pixel indices that get_frame computes. Pixels outside the region
+        of interest are left untouched in the frame buffer."""
+        return self.roi_pixels
+
+    @roi.setter
+    def roi(self, roi) -> None:
+        self.set_roi_pixels(compile_roi(roi))
+
+    def set_roi_pixels(self, pixels: array.array) -> None:
+        """Switch to a compiled ROI (see compile_roi) and rebuild the bad
+        pixel table for it."""
+        self.roi_pixels = pixels
+        self._extract_bad_pixel_neighbours()
+
+    def data_ready(self) -> bool:
+        """True when the sensor has a new subpage waiting to be read, so
+        get_frame() will not block on it."""
+        status_register = self.status_register
+        self._i2c_read_words(0x8000, status_register)
+        return (status_register[0] & 0x0008) != 0
 
     def get_frame(self, framebuf: typing.List[int]) -> None:
         """Request both 'halves' of a frame from the sensor, merge them
@@ -149,20 +261,40 @@ class MLX90640:
         into the 768-element array passed in!"""
         emissivity = 0.95
 
+        start = time.ticks_us()
         status = self._get_frame_data()
 
         if status < 0:
             raise RuntimeError('Frame data error')
+        read = time.ticks_us()
+        self.read_us = time.ticks_diff(read, start)
 
         tr = self._get_ta() - self.openair_ta_shift
 
         self._calculate_to(emissivity, tr, framebuf)
+        self.compensate_us = time.ticks_diff(time.ticks_us(), read)
+
+    def get_raw_frame(self, rawbuf: array.array) -> None:
+        """Read the next subpage without any compensation into an 834-element
+        'H' array: the 832 RAM words, the control register and the subpage
+        number. Together with ee_data this is all a host needs to calculate
+        temperatures itself."""
+        start = time.ticks_us()
+        status = self._get_frame_data()
+
+        if status < 0:
+            raise RuntimeError('Frame data error')
+        self.read_us = time.ticks_diff(time.ticks_us(), start)
+
+        frame = self.mlx90640_frame
+        for i in range(834):
+            rawbuf[i] = frame[i]
 
     def _get_frame_data(self) -> int:
         data_ready = 0
         cnt = 0
-        status_register = [0]
-        control_register = [0]
+        status_register = self.status_register
+        control_register = self.control_register
 
         while data_ready == 0:
             self._i2c_read_words(0x8000, status_register)
@@ -176,7 +308,9 @@ class MLX90640:
             data_ready = status_register[0] & 0x0008
             cnt += 1
 
+        self.i2c_retries += cnt - 1
         if cnt > 4:
+            self.i2c_failures += 1
             raise RuntimeError('Too many retries')
 
         self._i2c_read_words(0x800D, control_register)
@@ -254,10 +388,9 @@ class MLX90640:
             ir_data_cp[1] -= (self.cp_offset[1] + self.il_chess_c[0]) * (1 + self.cp_kta * (ta - 25)) * (
                 1 + self.cp_kv * (vdd - 3.3))
 
-        for pixel_number in range(768):
+        for pixel_number in self.roi_pixels:
             if self._is_pixel_bad(pixel_number):
-                result[pixel_number] = -273.15
-                continue
+                continue  # interpolated from its neighbours below
 
             il_pattern = pixel_number // 32 - (pixel_number // 64) * 2
             conversion_pattern = ((pixel_number + 2) // 4 - (pixel_number + 3) // 4 + (
@@ -321,6 +454,17 @@ class MLX90640:
 
                 result[pixel_number] = to
 
+        self._fill_bad_pixels(result)
+
+    def _fill_bad_pixels(self, result: typing.List[float]) -> None:
+        # Replace each broken/outlier pixel by the mean of its precomputed
+        # valid neighbours instead of a -273.15 marker that skews averages
+        for pixel, neighbours in self.bad_pixel_neighbours:
+            total = 0.0
+            for neighbour in neighbours:
+                total += result[neighbour]
+            result[pixel] = total / len(neighbours)
+
     def _extract_parameters(self) -> None:
         self._extract_vdd_parameters()
         self._extract_ptat_parameters()
@@ -336,6 +480,7 @@ class MLX90640:
         self._extract_kv_pixel_parameters()
         self._extract_cilc_parameters()
         self._extract_deviating_pixels()
+        self._extract_bad_pixel_neighbours()
 
     def _extract_vdd_parameters(self) -> None:
         # extract VDD
@@ -759,7 +904,34 @@ class MLX90640:
                 if self._are_pixels_adjacent(broken_pixel, outlier_pixel):
                     raise RuntimeError('Adjacent broken and outlier pixels')
 
+    def _extract_bad_pixel_neighbours(self):
+        # Neighbour table for bad pixel interpolation: the valid pixels
+        # directly above, below, left and right of each deviating pixel.
+        # Only pixels inside the ROI are computed, so bad pixels outside it
+        # are left out and only neighbours inside it count; a bad pixel
+        # without any keeps its previous value.
+        self.bad_pixels = self.broken_pixels | self.outlier_pixels
+        in_roi = bytearray(768)
+        for pixel in self.roi_pixels:
+            in_roi[pixel] = 1
+        table = []
+        for pixel in sorted(self.bad_pixels):
+            if not in_roi[pixel]:
+                continue
+            row, col = divmod(pixel, 32)
+            neighbours = tuple(
+                32 * r + c
+                for r, c in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1))
+                if 0 <= r < 24 and 0 <= c < 32 and in_roi[32 * r + c]
+                and 32 * r + c not in self.bad_pixels
+            )
+            if neighbours:
+                table.append((pixel, neighbours))
+        # Swapped in whole: the capture thread may be filling a frame
+        self.bad_pixel_neighbours = table
+
     def _unique_list_pairs(self, input_list: typing.List[int]) -> typing.Tuple[int, int]:
+        input_list = sorted(input_list)  # sets are not sliceable
         for i, list_value1 in enumerate(input_list):
             for list_value2 in input_list[i + 1:]:
                 yield list_value1, list_value2
@@ -777,18 +949,22 @@ class MLX90640:
         return False
 
     def _is_pixel_bad(self, pixel: int) -> bool:
-        return pixel in self.broken_pixels or pixel in self.outlier_pixels
+        return pixel in self.bad_pixels
+
+    def _update_control_register(self, mask: int, value: int) -> None:
+        control_register = [0]
+        self._i2c_read_words(0x800D, control_register)
+        self._i2c_write_word(0x800D, (control_register[0] & ~mask & 0xFFFF) | value)
 
     def _i2c_write_word(self, write_address: int, data: int) -> None:
-        cmd = bytearray(4)
+        cmd = self.cmdbuf
         cmd[0] = write_address >> 8
         cmd[1] = write_address & 0x00FF
         cmd[2] = data >> 8
         cmd[3] = data & 0x00FF
-        data_check = [0]
 
         self.i2c_device.write(cmd)
-        self._i2c_read_words(write_address, data_check)
+        self._i2c_read_words(write_address, self.control_register)
 
     def _i2c_read_words(
         self,
@@ -813,13 +989,47 @@ class MLX90640:
                 in_end=read_words * 2,
             )
 
-            outwords = struct.unpack(
-                '>' + 'H' * read_words,
-                self.inbuf if len(self.inbuf) == read_words * 2 else self.inbuf[:read_words * 2],
-            )
-            for i, w in enumerate(outwords):
-                buffer[offset + i] = w
+            # Big-endian words straight from the read buffer, without the
+            # format string, slice and tuple struct.unpack would allocate
+            inbuf = self.inbuf
+            for i in range(read_words):
+                buffer[offset + i] = (inbuf[2 * i] << 8) | inbuf[2 * i + 1]
 
             offset += read_words
             remaining_words -= read_words
             addr += read_words
+
+
+class SensorGroup:
+    """Interleaved capture from several MLX90640s, e.g. at different
+    addresses or on both hardware I2C controllers. Each sensor converts on
+    its own, so instead of blocking on one sensor's data-ready flag the group
+    polls them round-robin and only reads the ones that have a subpage
+    waiting. One sensor's conversion time then overlaps another's bus
+    transfer and compensation."""
+
+    def __init__(self, cams: typing.List[MLX90640], raw: bool = False) -> None:
+        self.cams = cams
+        self.raw = raw
+        if raw:
+            self.frames = [init_raw_array(834) for _ in cams]
+        else:
+            self.frames = [init_float_array(768) for _ in cams]
+        self._next = 0
+
+    def poll(self) -> int:
+        """Read the next sensor with data ready into self.frames[index],
+        compensated or as a raw subpage. Returns that index, or -1 if none is
+        ready."""
+        count = len(self.cams)
+        for i in range(count):
+            index = (self._next + i) % count
+            cam = self.cams[index]
+            if cam.data_ready():
+                self._next = (index + 1) % count
+                if self.raw:
+                    cam.get_raw_frame(self.frames[index])
+                else:
+                    cam.get_frame(self.frames[index])
+                return index
+        return -1
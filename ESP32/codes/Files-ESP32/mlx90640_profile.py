@@ -0,0 +1,114 @@
+# mlx90640_profile.py – Throughput/noise sweep for MLX90640 settings
+# Point the camera at a static scene and run from the REPL:
+#   import mlx90640_profile
+#   mlx90640_profile.run()
+# For every refresh rate x ADC resolution x I2C frequency it reports the
+# achieved subpage rate, dropped subpages and the temporal noise, so the
+# fastest configuration a room tolerates can be picked.
+
+import array, gc, math, time
+from machine import I2C, Pin
+import mlx90640
+
+RATES = (
+    mlx90640.RefreshRate.REFRESH_2_HZ,
+    mlx90640.RefreshRate.REFRESH_4_HZ,
+    mlx90640.RefreshRate.REFRESH_8_HZ,
+    mlx90640.RefreshRate.REFRESH_16_HZ,
+)
+RESOLUTIONS = (
+    mlx90640.Resolution.ADC_16_BIT,
+    mlx90640.Resolution.ADC_18_BIT,
+    mlx90640.Resolution.ADC_19_BIT,
+)
+I2C_FREQS = (400_000, 800_000, 1_000_000)
+
+WARMUP_SUBPAGES = 2  # the first subpages after a settings change are unsettled
+NOISE_FRAMES = 8  # complete frames (two subpages each) for the noise estimate
+
+
+def measure(cam, framebuf, duration_ms):
+    """Capture for duration_ms and return (subpages, dropped, elapsed_ms).
+    A subpage that repeats the previous one's parity means the sensor
+    overwrote one we never read."""
+    subpages = dropped = 0
+    last_sub_page = -1
+    start = time.ticks_ms()
+    while time.ticks_diff(time.ticks_ms(), start) < duration_ms:
+        try:
+            cam.get_frame(framebuf)
+        except RuntimeError:  # 'Too many retries' / 'Frame data error'
+            dropped += 1
+            continue
+        sub_page = cam.mlx90640_frame[833]
+        if sub_page == last_sub_page:
+            dropped += 1
+        last_sub_page = sub_page
+        subpages += 1
+    return subpages, dropped, time.ticks_diff(time.ticks_ms(), start)
+
+
+def temporal_noise(cam, framebuf, frames=NOISE_FRAMES):
+    """Mean over pixels of the per-pixel standard deviation across frames."""
+    total = array.array('f', bytearray(4 * 768))
+    total_sq = array.array('f', bytearray(4 * 768))
+    for _ in range(frames):
+        cam.get_frame(framebuf)
+        cam.get_frame(framebuf)  # both subpages, every pixel updated once
+        for p in range(768):
+            v = framebuf[p]
+            total[p] += v
+            total_sq[p] += v * v
+    noise = 0.0
+    for p in range(768):
+        mean = total[p] / frames
+        noise += math.sqrt(max(total_sq[p] / frames - mean * mean, 0.0))
+    return noise / 768
+
+
+def sweep(cam, rates=RATES, resolutions=RESOLUTIONS, i2c_freqs=(None,),
+          bus_factory=None, duration_ms=3000):
+    """Try every combination and return a list of result tuples
+    (rate, resolution, i2c_freq, fps, target_fps, dropped, noise).
+    bus_factory(freq) must return the I2C bus reopened at freq; it is only
+    needed when sweeping I2C frequencies."""
+    framebuf = array.array('f', bytearray(4 * 768))
+    results = []
+    for freq in i2c_freqs:
+        if freq is not None:
+            cam.i2c_device.i2c = bus_factory(freq)
+        for rate in rates:
+            for resolution in resolutions:
+                cam.refresh_rate = rate
+                cam.resolution = resolution
+                try:
+                    for _ in range(WARMUP_SUBPAGES):
+                        cam.get_frame(framebuf)
+                    subpages, dropped, elapsed_ms = measure(cam, framebuf, duration_ms)
+                    noise = temporal_noise(cam, framebuf)
+                except (OSError, RuntimeError) as e:
+                    print("rate", rate, "resolution", resolution, "freq", freq, "failed:", e)
+                    continue
+                fps = subpages * 1000 / elapsed_ms
+                results.append((rate, resolution, freq, fps,
+                                mlx90640.refresh_rate_hz(rate), dropped, noise))
+                gc.collect()
+    return results
+
+
+def print_results(results):
+    print("rate_hz  adc_bits  i2c_hz    fps     dropped  noise_C")
+    for rate, resolution, freq, fps, target_fps, dropped, noise in results:
+        print("{:<8} {:<9} {:<9} {:<7.2f} {:<8} {:.3f}".format(
+            target_fps, 16 + resolution, freq or "-", fps, dropped, noise))
+
+
+def run(scl=22, sda=21, address=0x33, duration_ms=3000):
+    def bus_factory(freq):
+        return I2C(0, scl=Pin(scl), sda=Pin(sda), freq=freq)
+
+    cam = mlx90640.MLX90640(bus_factory(I2C_FREQS[0]), address)
+    results = sweep(cam, i2c_freqs=I2C_FREQS, bus_factory=bus_factory,
+                    duration_ms=duration_ms)
+    print_results(results)
+    return results
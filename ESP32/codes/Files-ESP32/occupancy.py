@@ -0,0 +1,108 @@
+# occupancy.py – People counting on the ESP32
+# Pixels clearly warmer than a slowly adapting background are foreground;
+# 4-connected foreground blobs of at least MIN_BLOB_PIXELS are counted as
+# people. Everything works on centi-degree 'h' frames (FrameEncoder.quantize)
+# in arrays allocated once, so counting does not allocate per frame.
+
+import array, time
+
+THRESHOLD = 1.5  # degrees above the background
+MIN_BLOB_PIXELS = 3  # smaller blobs are noise or hot spots, not people
+BACKGROUND_SHIFT = 6  # background += (frame - background) >> BACKGROUND_SHIFT
+
+
+class BlobCounter:
+    def __init__(self, threshold=THRESHOLD, min_blob_pixels=MIN_BLOB_PIXELS,
+                 background_shift=BACKGROUND_SHIFT, report_every_ms=10_000):
+        self.threshold = int(threshold * 100)
+        self.min_blob_pixels = min_blob_pixels
+        self.background_shift = background_shift
+        self.report_every_ms = report_every_ms  # '#count' heartbeat
+
+        self.background = array.array('h', bytes(2 * 768))
+        self.foreground = bytearray(768)  # 1 = foreground, 2 = already labelled
+        self.stack = array.array('H', bytes(2 * 768))
+        self.primed = False
+
+        self.count = 0
+        self.foreground_pixels = 0
+        self.last_report = None
+
+    def update(self, centi, pixels):
+        """Count the people in a quantized frame, looking at pixels only.
+        Returns True when a '#count' event is due (count changed or the
+        heartbeat elapsed)."""
+        background, foreground = self.background, self.foreground
+        n = len(pixels)
+        if not self.primed:
+            # Assume the room starts empty
+            for k in range(n):
+                p = pixels[k]
+                background[p] = centi[p]
+            self.primed = True
+
+        # Background subtraction; people do not fade into the background
+        # because only background pixels adapt
+        threshold, shift = self.threshold, self.background_shift
+        for p in range(768):
+            foreground[p] = 0
+        hot = 0
+        for k in range(n):
+            p = pixels[k]
+            value = centi[p]
+            if value - background[p] > threshold:
+                foreground[p] = 1
+                hot += 1
+            else:
+                background[p] += (value - background[p]) >> shift
+        self.foreground_pixels = hot
+
+        count = self._count_blobs(pixels) if hot else 0
+        now = time.ticks_ms()
+        due = (count != self.count or self.last_report is None
+               or time.ticks_diff(now, self.last_report) >= self.report_every_ms)
+        self.count = count
+        if due:
+            self.last_report = now
+        return due
+
+    def _count_blobs(self, pixels):
+        """Flood fill each foreground blob with an explicit stack."""
+        foreground, stack = self.foreground, self.stack
+        count = 0
+        for k in range(len(pixels)):
+            seed = pixels[k]
+            if foreground[seed] != 1:
+                continue
+            foreground[seed] = 2
+            stack[0] = seed
+            top = 1
+            size = 0
+            while top:
+                top -= 1
+                p = stack[top]
+                size += 1
+                row, col = p >> 5, p & 31
+                if row > 0 and foreground[p - 32] == 1:
+                    foreground[p - 32] = 2
+                    stack[top] = p - 32
+                    top += 1
+                if row < 23 and foreground[p + 32] == 1:
+                    foreground[p + 32] = 2
+                    stack[top] = p + 32
+                    top += 1
+                if col > 0 and foreground[p - 1] == 1:
+                    foreground[p - 1] = 2
+                    stack[top] = p - 1
+                    top += 1
+                if col < 31 and foreground[p + 1] == 1:
+                    foreground[p + 1] = 2
+                    stack[top] = p + 1
+                    top += 1
+            if size >= self.min_blob_pixels:
+                count += 1
+        return count
+
+    def count_line(self, tag=""):
+        """'#count,<people>,<foreground pixels>' line."""
+        return "{}#count,{},{}\n".format(tag, self.count, self.foreground_pixels)
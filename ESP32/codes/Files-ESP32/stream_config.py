@@ -0,0 +1,76 @@
+# stream_config.py – Stream settings the host can change while streaming
+# Registers the configuration commands of command_channel.py. Arguments are
+# checked when the command arrives, so a bad one is answered with '#error'
+# and changes nothing; sensor registers are written by the capture thread
+# between subpages (FramePipeline.apply), output settings take effect with
+# the next frame, which is a keyframe.
+
+import binascii
+import mlx90640
+
+
+class StreamConfig:
+    def __init__(self, cams, pipeline, output, backlog=None):
+        self.cams = cams
+        self.pipeline = pipeline
+        self.output = output
+        self.backlog = backlog
+
+    def register(self, commands):
+        commands.register("rate", self.rate)
+        commands.register("encoding", self.encoding)
+        commands.register("roi", self.roi)
+
+    def rate(self, hz):
+        """'rate,<hz>': refresh rate of every sensor, 0.5 to 64 Hz in powers
+        of two. Capture is paced to it."""
+        hz = float(hz)
+        for rate in range(8):
+            if mlx90640.refresh_rate_hz(rate) == hz:
+                break
+        else:
+            raise ValueError("not a sensor refresh rate")
+        cams, scheduler = self.cams, self.pipeline.scheduler
+        period_ms = int(1000 / hz / len(cams))
+
+        def change():
+            for cam in cams:
+                cam.refresh_rate = rate
+            if scheduler:
+                scheduler.period_ms = period_ms
+        self.pipeline.apply(change)
+
+    def encoding(self, encoding, value=None):
+        """'encoding,csv', 'encoding,delta[,<degrees>]' or
+        'encoding,pack[,<step>]', see FrameOutput.set_encoding."""
+        self.output.set_encoding(encoding, value)
+        self.output.reset()
+
+    def roi(self, mask, sensor=None):
+        """'roi,full' or 'roi,<mask>' with the 192 hex digits of a '#roi'
+        line, for every sensor or only sensor <sensor>."""
+        if self.output.raw:
+            raise ValueError("raw mode")
+        if mask == "full":
+            pixels = mlx90640.compile_roi(None)
+        else:
+            if len(mask) != 192:
+                raise ValueError("mask needs 192 hex digits")
+            bits = binascii.unhexlify(mask)
+            pixels = mlx90640.compile_roi(
+                bytes((bits[p >> 3] >> (p & 7)) & 1 for p in range(768)))
+        if sensor is None:
+            cams = self.cams
+        else:
+            sensor = int(sensor)
+            if not 0 <= sensor < len(self.cams):
+                raise ValueError("no such sensor")
+            cams = (self.cams[sensor],)
+        # The capture thread reads roi_pixels and the bad pixel table once
+        # per subpage, so swapping them needs no handoff; at worst one frame
+        # mixes old and new
+        for cam in cams:
+            cam.set_roi_pixels(pixels)
+        self.output.roi_changed()
+        if self.backlog:
+            self.backlog.start()
@@ -0,0 +1,83 @@
+# telemetry.py – Firmware performance counters
+# Collects what the capture pipeline, the drivers and the heap monitor count
+# into one record, sent as a '#stats,<name>=<value>,...' line over USB and as
+# little-endian uint32s in FIELDS order on main_ble.py's telemetry
+# characteristic. Stage timings are smoothed over the last ~8 frames.
+
+import gc, struct, time
+
+FIELDS = (
+    "uptime_s",
+    "captured",  # subpages read by the capture thread
+    "sent",  # frames that went out (change detection and count mode skip some)
+    "dropped",  # captured while the sender was still busy with the last one
+    "skipped",  # subpages the sensors overwrote before they were read
+    "i2c_retries",
+    "i2c_failures",  # 'Too many retries'
+    "errors",  # other capture exceptions
+    "read_us",
+    "compensate_us",
+    "encode_us",
+    "transmit_us",
+    "heap_free",
+    "heap_largest",
+    "gc_max_ms",
+    "memory_errors",
+)
+PACK_FORMAT = "<" + "I" * len(FIELDS)
+SMOOTHING = 3  # stage timings: avg += (sample - avg) >> SMOOTHING
+
+
+class Telemetry:
+    def __init__(self, cams, pipeline, heap):
+        self.cams = cams
+        self.pipeline = pipeline
+        self.heap = heap
+        self.started = time.time()
+
+        self.sent = 0
+        self.read_us = 0
+        self.compensate_us = 0
+        self.encode_us = 0
+        self.transmit_us = 0
+        self.values = [0] * len(FIELDS)
+
+    def frame_sent(self, cam, encode_us, transmit_us):
+        """Account a frame of cam that was encoded and sent."""
+        self.sent += 1
+        self.read_us += (cam.read_us - self.read_us) >> SMOOTHING
+        self.compensate_us += (cam.compensate_us - self.compensate_us) >> SMOOTHING
+        self.encode_us += (encode_us - self.encode_us) >> SMOOTHING
+        self.transmit_us += (transmit_us - self.transmit_us) >> SMOOTHING
+
+    def collect(self):
+        """Refresh self.values (in FIELDS order) and return them."""
+        pipeline, heap, cams = self.pipeline, self.heap, self.cams
+        values = self.values
+        values[0] = int(time.time() - self.started)
+        values[1] = pipeline.captured
+        values[2] = self.sent
+        values[3] = pipeline.dropped
+        values[4] = pipeline.scheduler.skipped if pipeline.scheduler else 0
+        values[5] = sum(cam.i2c_retries for cam in cams)
+        values[6] = sum(cam.i2c_failures for cam in cams)
+        values[7] = pipeline.errors
+        values[8] = self.read_us
+        values[9] = self.compensate_us
+        values[10] = self.encode_us
+        values[11] = self.transmit_us
+        values[12] = gc.mem_free()
+        values[13] = heap.largest_free()
+        values[14] = heap.max_gc_ms
+        values[15] = heap.memory_errors + pipeline.memory_errors
+        return values
+
+    def stats_line(self):
+        """'#stats' line for the USB stream."""
+        values = self.collect()
+        return "#stats," + ",".join(
+            "{}={}".format(name, values[k]) for k, name in enumerate(FIELDS)) + "\n"
+
+    def pack(self):
+        """Binary record for the telemetry characteristic."""
+        return struct.pack(PACK_FORMAT, *self.collect())
@@ -0,0 +1,165 @@
+# thermal_codec.py – Delta + varint/run-length coding of thermal frames
+# Plain Python on array/bytearray only, so the same file runs on the ESP32
+# (MicroPython) and on the host, which imports it from Files-ESP32.
+#
+# Frames come in as centi-degree 'h' arrays (FrameEncoder.quantize) and are
+# optionally coarsened to `step` centi-degrees. One message is:
+#   byte    flags, bit 0 set on keyframes
+#   byte    sequence number, +1 per message (mod 256), so a decoder notices
+#           a lost message instead of applying the next delta to a stale frame
+#   varint  step
+#   varint  pixel count n
+#   tokens  n residuals. A keyframe predicts each pixel from the one before
+#           it (0 for the first), any other frame from the same pixel of the
+#           previous frame. Each token is a varint: zigzag(r) << 1 for a
+#           residual r != 0, or (k - 1) << 1 | 1 for a run of k zero residuals,
+#           so still pixels and small changes both cost a single byte.
+# Keyframes come every `keyframe_every` messages so a listener can resync.
+
+import array
+
+KEYFRAME = 0x01
+
+
+class Encoder:
+    def __init__(self, pixels=768, step=1, keyframe_every=32):
+        self.step = step
+        self.keyframe_every = keyframe_every
+        self.previous = array.array('h', bytes(2 * pixels))  # quantized, by position
+        # Header, then at most 3 bytes per token (|r| < 2**16)
+        self.buf = bytearray(3 * pixels + 8)
+        self.view = memoryview(self.buf)
+        self.count = 0
+        self.sequence = 0
+        self._pixels = -1
+
+    def reset(self):
+        """Make the next message a keyframe."""
+        self.count = 0
+
+    def _varint(self, pos, value):
+        buf = self.buf
+        while value > 0x7F:
+            buf[pos] = (value & 0x7F) | 0x80
+            value >>= 7
+            pos += 1
+        buf[pos] = value
+        return pos + 1
+
+    def encode(self, centi, pixels):
+        """Encode centi[p] for p in pixels; returns a memoryview of the
+        message, valid until the next call."""
+        n_pixels = len(pixels)
+        if n_pixels != self._pixels:
+            self._pixels = n_pixels
+            self.count = 0
+        key = self.count % self.keyframe_every == 0
+        self.count += 1
+
+        buf, previous = self.buf, self.previous
+        step = self.step
+        half = step // 2
+        buf[0] = KEYFRAME if key else 0
+        buf[1] = self.sequence
+        self.sequence = (self.sequence + 1) & 0xFF
+        n = self._varint(2, step)
+        n = self._varint(n, n_pixels)
+
+        run = 0
+        last = 0
+        for k in range(n_pixels):
+            q = centi[pixels[k]]
+            if step > 1:
+                q = (q + half) // step
+            if key:
+                r = q - last
+                last = q
+            else:
+                r = q - previous[k]
+            previous[k] = q
+            if r == 0:
+                run += 1
+                continue
+            if run:
+                n = self._varint(n, (run - 1) << 1 | 1)
+                run = 0
+            n = self._varint(n, r << 2 if r > 0 else ((-r) << 2) - 2)
+        if run:
+            n = self._varint(n, (run - 1) << 1 | 1)
+        return self.view[:n]
+
+
+class Decoder:
+    def __init__(self):
+        self.values = None  # centi-degrees of the last decoded frame
+        self._previous = None  # the same, in quantized units
+        self._sequence = -1
+
+    def decode(self, data):
+        """Decode one message into self.values (an 'l' array of n
+        centi-degrees, in pixel order) and return it. Raises ValueError on
+        truncated messages or a delta without its keyframe."""
+        end = len(data)
+        pos = 2
+        if end < 4:
+            raise ValueError("Message too short")
+        key = data[0] & KEYFRAME
+        sequence = data[1]
+        step, pos = _read_varint(data, pos, end)
+        n_pixels, pos = _read_varint(data, pos, end)
+
+        previous = self._previous
+        if not key and (previous is None or len(previous) != n_pixels):
+            raise ValueError("Delta message without its keyframe")
+        if not key and sequence != (self._sequence + 1) & 0xFF:
+            self._previous = None  # wait for the next keyframe
+            raise ValueError("Message lost before this delta")
+        # Decode into a fresh copy so a corrupted message leaves the state
+        previous = array.array('l', [0] * n_pixels if key else previous)
+
+        k = 0
+        last = 0
+        while k < n_pixels:
+            token, pos = _read_varint(data, pos, end)
+            if token & 1:
+                run = (token >> 1) + 1
+                if k + run > n_pixels:
+                    raise ValueError("Run past the end of the frame")
+                if key:
+                    for j in range(k, k + run):
+                        previous[j] = last
+                k += run
+                continue
+            token >>= 1
+            r = -((token + 1) >> 1) if token & 1 else token >> 1
+            if key:
+                last += r
+                previous[k] = last
+            else:
+                previous[k] += r
+            k += 1
+        if pos != end:
+            raise ValueError("Trailing bytes after the frame")
+
+        self._previous = previous
+        self._sequence = sequence
+        values = self.values
+        if values is None or len(values) != n_pixels:
+            values = self.values = array.array('l', [0] * n_pixels)
+        for j in range(n_pixels):
+            values[j] = previous[j] * step
+        return values
+
+
+def _read_varint(data, pos, end):
+    value = 0
+    shift = 0
+    while True:
+        if pos >= end:
+            raise ValueError("Truncated varint")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
@@ -3,11 +3,16 @@ from bleak import BleakClient, BleakScanner
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
-import random
+import thermal_stream
+from frame_store import FrameStore
 
 DEVICE_NAME = "ESP32-BLE"
 SERVICE_UUID = "12345678-1234-5678-1234-56789abcdef0"
 CHARACTERISTIC_UUID = "12345678-1234-5678-1234-56789abcdef1"
+SENSOR = 0  # which sensor to show when the ESP32 streams several
+# Every session appends here (frame_store.py); ml_model.py loads it with the
+# older per-frame .npy files
+STORE_PATH = "dataset/frames.frames"
 
 # Custom colormap
 colors = [
@@ -28,52 +33,38 @@ plt.title("Live MLX90640 BLE frame")
 plt.ion()
 plt.show()
 
-frame_buffer = bytearray()
+assembler = thermal_stream.LineAssembler()
+decoder = thermal_stream.FrameDecoder()
+store = FrameStore(STORE_PATH)
 save_frames = False
 frames_to_save = 0
 label = 0
 
-# Helper to clear buffer
-def clear_buffer():
-    global frame_buffer
-    frame_buffer = bytearray()
-
 # Notification handler
 async def notification_handler(sender, data):
-    global frame_buffer, save_frames, frames_to_save, label
-
-    frame_buffer.extend(data)
+    global save_frames, frames_to_save, label
 
-    if frame_buffer.count(b',') >= 767:
+    for line in assembler.feed(data):
         try:
-            frame_str = frame_buffer.decode()
-            values = np.fromstring(frame_str, sep=',')
-
-            if values.size == 768:
-                reshaped_frame = values.reshape(24,32)
-                img.set_data(reshaped_frame)
-                plt.pause(0.001)
-
-                if save_frames and frames_to_save > 0:
-                    frame_id = random.randint(0, 10000)
-                    filename = f"thermal_frame_label_{label}_ID{frame_id:05d}.npy"
-
-                    np.save("dataset/"+filename, reshaped_frame)
-
-                    print(f"Saved: {filename}")
-                    frames_to_save -= 1
+            sensor, reshaped_frame = decoder.decode_line(line)
+        except ValueError:
+            print("⚠️ Incomplete or corrupted frame received, skipping.")
+            continue
 
-                    if frames_to_save == 0:
-                        save_frames = False
-                        print("Done saving frames.")
+        if reshaped_frame is None or sensor != SENSOR:
+            continue
 
-            else:
-                print("⚠️ Incomplete frame received, skipping.")
+        img.set_data(reshaped_frame)
+        plt.pause(0.001)
 
-        except UnicodeDecodeError:
-            print("⚠️ Decode error, corrupted data. Skipping frame.")
+        if save_frames and frames_to_save > 0:
+            # Queued for the store's writer thread; no disk I/O in here
+            store.append(reshaped_frame, label)
+            frames_to_save -= 1
 
-        clear_buffer()
+            if frames_to_save == 0:
+                save_frames = False
+                print("Done saving frames.")
 
 # Function to capture keypresses
 def on_key(event):
@@ -109,6 +100,8 @@ async def connect_and_receive():
         try:
             async with BleakClient(device.address) as client:
                 print("Connected! Subscribing to notifications...")
+                # Whatever encoding the board streams (shared with any other
+                # host), FrameDecoder rebuilds the measured frames
                 await client.start_notify(CHARACTERISTIC_UUID, notification_handler)
 
                 while client.is_connected:
@@ -121,4 +114,8 @@ async def connect_and_receive():
             await asyncio.sleep(2)
 
 if __name__ == "__main__":
-    asyncio.run(connect_and_receive())
+    try:
+        asyncio.run(connect_and_receive())
+    finally:
+        store.close()
+        print(f"{store.written} frames in {STORE_PATH}")
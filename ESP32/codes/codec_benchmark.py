@@ -0,0 +1,128 @@
+"""
+Compare frame encodings by size and CPU cost: the CSV lines the firmware
+streams, raw int16, zlib on int16, and Files-ESP32/thermal_codec.py.
+
+    python codec_benchmark.py                 # synthetic room with a walker
+    python codec_benchmark.py dataset/        # .npy frames from the frame saver
+    python codec_benchmark.py dataset/frames.frames   # or its frame store
+
+Encode/decode times are host CPU time per frame; on the ESP32 only CSV and
+thermal_codec run, and scale roughly the same way relative to each other.
+"""
+import array
+import glob
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+
+import frame_store
+import thermal_stream  # noqa: F401  (puts Files-ESP32 on the path)
+import thermal_codec
+
+FRAME_SHAPE = (24, 32)
+
+
+def synthetic_frames(count=200, seed=0):
+    """A 22 °C room with sensor noise and a 34 °C blob walking across."""
+    rng = np.random.default_rng(seed)
+    background = 22 + rng.normal(0, 0.3, FRAME_SHAPE)
+    rows, cols = np.mgrid[0:24, 0:32]
+    frames = []
+    for t in range(count):
+        frame = background + rng.normal(0, 0.1, FRAME_SHAPE)
+        if count // 4 <= t < 3 * count // 4:
+            x = (t - count // 4) * 32 / (count // 2)
+            blob = np.exp(-((cols - x) ** 2 + (rows - 12) ** 2) / 8)
+            frame += 12 * blob
+        frames.append(frame.astype(np.float32))
+    return frames
+
+
+def load_frames(directory):
+    if os.path.isfile(directory):
+        return list(frame_store.load_frames(directory)[0])
+    paths = sorted(glob.glob(os.path.join(directory, '*.npy')))
+    if not paths:
+        raise SystemExit(f"No .npy frames in {directory}")
+    return [np.load(path).astype(np.float32).reshape(FRAME_SHAPE) for path in paths]
+
+
+def to_centi(frame):
+    return np.clip(np.round(frame * 100), -32767, 32767).astype(np.int16)
+
+
+def csv_codec():
+    def encode(frame):
+        return (','.join('{:.2f}'.format(v) for v in frame.ravel()) + '\n').encode()
+
+    def decode(data):
+        return np.fromstring(data.decode(), sep=',', dtype=np.float32)
+    return encode, decode
+
+
+def int16_codec():
+    def encode(frame):
+        return to_centi(frame).tobytes()
+
+    def decode(data):
+        return np.frombuffer(data, dtype=np.int16) / 100
+    return encode, decode
+
+
+def zlib_codec(level=6):
+    def encode(frame):
+        return zlib.compress(to_centi(frame).tobytes(), level)
+
+    def decode(data):
+        return np.frombuffer(zlib.decompress(data), dtype=np.int16) / 100
+    return encode, decode
+
+
+def thermal_codec_codec(step=1, keyframe_every=32):
+    encoder = thermal_codec.Encoder(step=step, keyframe_every=keyframe_every)
+    decoder = thermal_codec.Decoder()
+    pixels = array.array('H', range(768))
+
+    def encode(frame):
+        # Same input as on the ESP32: a centi-degree 'h' array
+        return bytes(encoder.encode(array.array('h', to_centi(frame).ravel().tolist()), pixels))
+
+    def decode(data):
+        return np.asarray(decoder.decode(data), dtype=np.float32) / 100
+    return encode, decode
+
+
+CODECS = (
+    ('CSV (firmware)', csv_codec),
+    ('int16', int16_codec),
+    ('zlib int16', zlib_codec),
+    ('thermal_codec', thermal_codec_codec),
+    ('thermal_codec 0.1C', lambda: thermal_codec_codec(step=10)),
+)
+
+
+def run(frames):
+    print(f"{len(frames)} frames")
+    print(f"{'encoding':<20}{'bytes/frame':>12}{'ratio':>8}{'enc us':>10}{'dec us':>10}{'max err':>10}")
+    baseline = None
+    for name, factory in CODECS:
+        encode, decode = factory()
+        start = time.perf_counter()
+        messages = [encode(frame) for frame in frames]
+        encode_us = (time.perf_counter() - start) / len(frames) * 1e6
+        start = time.perf_counter()
+        decoded = [decode(message) for message in messages]
+        decode_us = (time.perf_counter() - start) / len(frames) * 1e6
+
+        size = sum(len(message) for message in messages) / len(frames)
+        baseline = baseline or size
+        error = max(float(np.max(np.abs(np.asarray(d, dtype=np.float64).ravel() - f.ravel())))
+                    for d, f in zip(decoded, frames))
+        print(f"{name:<20}{size:>12.0f}{baseline / size:>8.1f}{encode_us:>10.0f}{decode_us:>10.0f}{error:>10.3f}")
+
+
+if __name__ == '__main__':
+    run(load_frames(sys.argv[1]) if len(sys.argv) > 1 else synthetic_frames())
@@ -0,0 +1,183 @@
+"""
+Append-only store for labelled thermal frames.
+
+Saving a dataset as one .npy file per frame costs a file (and a disk block)
+per 3 KB and a synchronous write in the receive loop. FrameStore instead
+queues frames to a background thread, which writes them in chunks to one
+file that only ever grows:
+
+    store = FrameStore('dataset/session.frames')
+    store.append(frame, label)        # returns at once
+    store.close()                     # writes what is left
+
+    frames, labels, timestamps = load_frames('dataset/session.frames')
+
+Chunk layout: b'TFRM', uint32 frame count n, then n (int32 label, float64
+unix time) index entries, then n frames of 768 little-endian float32. Each
+chunk stands alone, so an interrupted session keeps every chunk before the
+last, and read_index() gets labels without reading the frames.
+
+    python frame_store.py import dataset/ dataset/all.frames   # old .npy files
+"""
+import glob
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+FRAME_SHAPE = (24, 32)
+FRAME_PIXELS = 768
+CHUNK_MAGIC = b'TFRM'
+CHUNK_HEADER = struct.Struct('<4sI')
+INDEX_DTYPE = np.dtype([('label', '<i4'), ('timestamp', '<f8')])
+FRAME_BYTES = FRAME_PIXELS * 4
+
+CHUNK_FRAMES = 256  # ~800 KB per write
+FLUSH_SECONDS = 2.0  # a partial chunk is written after this long
+
+
+class FrameStore:
+    def __init__(self, path, chunk_frames=CHUNK_FRAMES, flush_seconds=FLUSH_SECONDS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.flush_seconds = flush_seconds
+        self.file = open(path, 'ab')
+        self.appended = 0
+        self.written = 0
+        self._queue = queue.Queue()
+        self._error = None
+        self._writer = threading.Thread(target=self._write_loop, name='frame-store', daemon=True)
+        self._writer.start()
+
+    def append(self, frame, label, timestamp=None):
+        """Queue a (24, 32) frame with its label; never waits for the disk."""
+        if self._error:
+            raise self._error
+        frame = np.asarray(frame, dtype='<f4').reshape(FRAME_PIXELS)
+        if timestamp is None:
+            timestamp = time.time()
+        # The copy keeps the caller free to reuse its buffer
+        self._queue.put((frame.copy(), int(label), timestamp))
+        self.appended += 1
+
+    def close(self):
+        """Write all queued frames and close the file."""
+        self._queue.put(None)
+        self._writer.join()
+        self.file.close()
+        if self._error:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_loop(self):
+        frames = np.empty((self.chunk_frames, FRAME_PIXELS), dtype='<f4')
+        index = np.empty(self.chunk_frames, dtype=INDEX_DTYPE)
+        count = 0
+        deadline = None
+        while True:
+            try:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False  # time to write the partial chunk
+            if item:
+                frame, label, timestamp = item
+                frames[count] = frame
+                index[count] = (label, timestamp)
+                count += 1
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_seconds
+            if count and (count == self.chunk_frames or not item):
+                # After a failed write the file is suspect: later frames are
+                # dropped, and append() and close() raise the error
+                if not self._error:
+                    try:
+                        self._write_chunk(index[:count], frames[:count])
+                        self.written += count
+                    except OSError as e:
+                        self._error = e
+                count = 0
+                deadline = None
+            if item is None:
+                return
+
+    def _write_chunk(self, index, frames):
+        self.file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, len(index))
+                        + index.tobytes() + frames.tobytes())
+        self.file.flush()
+
+
+def _chunks(path, with_frames=True):
+    """Yield (index, frames or None) per complete chunk."""
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                return
+            magic, count = CHUNK_HEADER.unpack(header)
+            if magic != CHUNK_MAGIC:
+                raise ValueError(f"Not a frame store chunk at byte {f.tell() - CHUNK_HEADER.size}")
+            index_bytes = f.read(count * INDEX_DTYPE.itemsize)
+            if len(index_bytes) < count * INDEX_DTYPE.itemsize:
+                return  # cut short while writing
+            index = np.frombuffer(index_bytes, dtype=INDEX_DTYPE)
+            if with_frames:
+                data = f.read(count * FRAME_BYTES)
+                if len(data) < count * FRAME_BYTES:
+                    return
+                yield index, np.frombuffer(data, dtype='<f4').reshape((count,) + FRAME_SHAPE)
+            else:
+                end = f.tell() + count * FRAME_BYTES
+                if f.seek(0, os.SEEK_END) < end:
+                    return
+                f.seek(end)
+                yield index, None
+
+
+def read_index(path):
+    """Labels and timestamps of every stored frame, without the frames."""
+    chunks = [index for index, _ in _chunks(path, with_frames=False)]
+    index = np.concatenate(chunks) if chunks else np.empty(0, dtype=INDEX_DTYPE)
+    return index['label'], index['timestamp']
+
+
+def load_frames(path):
+    """(frames (n, 24, 32) float32, labels (n,), timestamps (n,))."""
+    indexes, frames = [], []
+    for index, chunk in _chunks(path):
+        indexes.append(index)
+        frames.append(chunk)
+    if not frames:
+        return (np.empty((0,) + FRAME_SHAPE, dtype=np.float32),
+                np.empty(0, dtype=np.int32), np.empty(0))
+    index = np.concatenate(indexes)
+    return np.concatenate(frames), index['label'], index['timestamp']
+
+
+def import_npy(directory, path):
+    """Append the one-file-per-frame dataset in directory (labels from the
+    'thermal_frame_label_<label>_ID<id>.npy' names) to the store at path."""
+    files = sorted(glob.glob(os.path.join(directory, '*.npy')))
+    with FrameStore(path) as store:
+        for file in files:
+            label = int(os.path.basename(file).split('_')[3])
+            store.append(np.load(file), label, os.path.getmtime(file))
+    return len(files)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'import':
+        sys.exit(__doc__)
+    print(f"Imported {import_npy(sys.argv[2], sys.argv[3])} frames into {sys.argv[3]}")
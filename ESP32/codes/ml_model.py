@@ -7,14 +7,19 @@ from sklearn.metrics import confusion_matrix, precision_score, recall_score, mea
 import keras_tuner as kt
 import matplotlib.pyplot as plt
 from scipy.ndimage import rotate, shift, gaussian_filter
+import frame_store
 
-# Load dataset
+# Load dataset: frame stores (frame_store.py) and single-frame .npy files
 def load_data(dataset_dir):
     X, y = [], []
 
-    for file in os.listdir(dataset_dir):
-        if file.endswith('.npy'):
-            path = os.path.join(dataset_dir, file)
+    for file in sorted(os.listdir(dataset_dir)):
+        path = os.path.join(dataset_dir, file)
+        if file.endswith('.frames'):
+            frames, labels, _ = frame_store.load_frames(path)
+            X.extend(frames)
+            y.extend(labels)
+        elif file.endswith('.npy'):
             frame = np.load(path)
             label = int(file.split('_')[3])
             X.append(frame)
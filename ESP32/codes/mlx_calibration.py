@@ -0,0 +1,206 @@
+"""
+Host-side MLX90640 calibration for frames streamed in raw mode.
+
+A numpy port of the compensation in Files-ESP32/mlx90640.py: the EEPROM dump
+is turned into per-pixel parameter arrays once, and every raw subpage is then
+compensated for all of its pixels at once.
+"""
+import numpy as np
+
+FRAME_PIXELS = 768
+SCALE_ALPHA = 0.000001
+OPENAIR_TA_SHIFT = 8
+
+
+def _signed(value, bits):
+    """Two's complement of an unsigned bit field (scalar or array)."""
+    value = np.asarray(value, dtype=np.int64)
+    return np.where(value >= 1 << (bits - 1), value - (1 << bits), value)
+
+
+def _nibbles(words):
+    """Split 16-bit words into their signed 4-bit fields, lowest first."""
+    words = np.asarray(words, dtype=np.int64)
+    fields = (words[:, None] >> np.array([0, 4, 8, 12])) & 0xF
+    return _signed(fields.ravel(), 4)
+
+
+def _quantize(values, limit):
+    """Mimic the driver's fixed point storage of alpha/kta/kv, which rounds
+    the values to integers at a power-of-two scale. Returns (ints, scale)."""
+    temp = np.max(np.abs(values))
+    scale = 0
+    while temp < limit:
+        temp *= 2
+        scale += 1
+    scaled = values * 2.0 ** scale
+    return np.where(scaled < 0, np.trunc(scaled - 0.5), np.trunc(scaled + 0.5)), scale
+
+
+class MLX90640Calibration:
+    """Calibration parameters of one sensor, extracted from its EEPROM."""
+
+    def __init__(self, ee_data):
+        ee = np.asarray(ee_data, dtype=np.int64)[:832]
+        if ee.size != 832:
+            raise ValueError(f"EEPROM dump has {ee.size} words, expected 832")
+        e = [int(w) for w in ee[:64]]
+
+        # Supply voltage and PTAT
+        self.k_vdd = int(_signed((e[51] & 0xFF00) >> 8, 8)) * 32
+        self.vdd25 = (((e[51] & 0x00FF) - 256) << 5) - 8192
+        self.kv_ptat = int(_signed((e[50] & 0xFC00) >> 10, 6)) / 4096
+        self.kt_ptat = int(_signed(e[50] & 0x03FF, 10)) / 8
+        self.v_ptat25 = e[49]
+        self.alpha_ptat = (e[16] & 0xF000) / 2 ** 14 + 8
+
+        self.gain_ee = int(_signed(e[48], 16))
+        self.tgc = int(_signed(e[60] & 0x00FF, 8)) / 32
+        self.resolution_ee = (e[56] & 0x3000) >> 12
+        self.ks_ta = int(_signed((e[60] & 0xFF00) >> 8, 8)) / 8192
+
+        # Temperature ranges
+        step = ((e[63] & 0x3000) >> 12) * 10
+        ct2 = ((e[63] & 0x00F0) >> 4) * step
+        self.ct = np.array([-40, 0, ct2, ct2 + ((e[63] & 0x0F00) >> 8) * step], dtype=np.float64)
+        ks_to_scale = 1 << ((e[63] & 0x000F) + 8)
+        ks_to = [e[61] & 0x00FF, (e[61] & 0xFF00) >> 8, e[62] & 0x00FF, (e[62] & 0xFF00) >> 8]
+        self.ks_to = _signed(ks_to, 8) / ks_to_scale
+
+        # Compensation pixels
+        alpha_scale = ((e[32] & 0xF000) >> 12) + 27
+        offset_sp0 = int(_signed(e[58] & 0x03FF, 10))
+        self.cp_offset = (offset_sp0, int(_signed((e[58] & 0xFC00) >> 10, 6)) + offset_sp0)
+        alpha_sp0 = int(_signed(e[57] & 0x03FF, 10)) / 2 ** alpha_scale
+        alpha_sp1 = (1 + int(_signed((e[57] & 0xFC00) >> 10, 6)) / 128) * alpha_sp0
+        self.cp_kta = int(_signed(e[59] & 0x00FF, 8)) / 2 ** (((e[56] & 0x00F0) >> 4) + 8)
+        self.cp_kv = int(_signed((e[59] & 0xFF00) >> 8, 8)) / 2 ** ((e[56] & 0x0F00) >> 8)
+
+        pixel_words = ee[64:64 + FRAME_PIXELS]
+        rows = np.arange(FRAME_PIXELS) // 32
+        cols = np.arange(FRAME_PIXELS) % 32
+
+        # Sensitivity (alpha)
+        acc_row = _nibbles(ee[34:40])[rows]
+        acc_column = _nibbles(ee[40:48])[cols]
+        alpha = _signed((pixel_words & 0x03F0) >> 4, 6) * (1 << (e[32] & 0x000F))
+        alpha = alpha + e[33] + (acc_row << ((e[32] & 0x0F00) >> 8)) + (acc_column << ((e[32] & 0x00F0) >> 4))
+        alpha = alpha / 2.0 ** (((e[32] & 0xF000) >> 12) + 30)
+        alpha = alpha - self.tgc * (alpha_sp0 + alpha_sp1) / 2
+        alpha, alpha_scale = _quantize(SCALE_ALPHA / alpha, 32768)
+        self.alpha_inv = SCALE_ALPHA * 2.0 ** alpha_scale / alpha
+
+        # Offset
+        occ_row = _nibbles(ee[18:24])[rows]
+        occ_column = _nibbles(ee[24:32])[cols]
+        offset = _signed((pixel_words & 0xFC00) >> 10, 6) * (1 << (e[16] & 0x000F))
+        self.offset = (offset + int(_signed(e[17], 16)) + (occ_row << ((e[16] & 0x0F00) >> 8))
+                       + (occ_column << ((e[16] & 0x00F0) >> 4))).astype(np.float64)
+
+        # Per pixel Kta and Kv, indexed by row/column parity
+        split = 2 * (rows % 2) + cols % 2
+        kta_rc = _signed([(e[54] & 0xFF00) >> 8, (e[55] & 0xFF00) >> 8, e[54] & 0x00FF, e[55] & 0x00FF], 8)
+        kta = _signed((pixel_words & 0x000E) >> 1, 3) * (1 << (e[56] & 0x000F)) + kta_rc[split]
+        kta, kta_scale = _quantize(kta / 2.0 ** (((e[56] & 0x00F0) >> 4) + 8), 64)
+        self.kta = kta / 2.0 ** kta_scale
+        kv_t = _signed([(e[52] & 0xF000) >> 12, (e[52] & 0x00F0) >> 4, (e[52] & 0x0F00) >> 8, e[52] & 0x000F], 4)
+        kv, kv_scale = _quantize(kv_t[split] / 2.0 ** ((e[56] & 0x0F00) >> 8), 64)
+        self.kv = kv / 2.0 ** kv_scale
+
+        # Chess/interleave correction
+        self.calibration_mode_ee = ((e[10] & 0x0800) >> 4) ^ 0x80
+        self.il_chess_c = (
+            int(_signed(e[53] & 0x003F, 6)) / 16.0,
+            int(_signed((e[53] & 0x07C0) >> 6, 5)) / 2.0,
+            int(_signed((e[53] & 0xF800) >> 11, 5)) / 8.0,
+        )
+        p = np.arange(FRAME_PIXELS)
+        self.il_pattern = p // 32 - (p // 64) * 2
+        self.chess_pattern = self.il_pattern ^ (p % 2)
+        self.conversion_pattern = ((p + 2) // 4 - (p + 3) // 4 + (p + 1) // 4 - p // 4) * (1 - 2 * self.il_pattern)
+
+        # Broken (all zero) and outlier pixels, filled from their neighbours
+        is_bad = (pixel_words == 0) | (pixel_words & 0x0001 != 0)
+        self.bad_pixels = np.flatnonzero(is_bad)
+        self.good_pixels = ~is_bad
+        bad = set(self.bad_pixels.tolist())
+        self.neighbours = np.zeros((self.bad_pixels.size, 4), dtype=np.intp)
+        self.weights = np.zeros((self.bad_pixels.size, 4))
+        for i, pixel in enumerate(self.bad_pixels):
+            row, col = divmod(int(pixel), 32)
+            valid = [32 * r + c for r, c in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1))
+                     if 0 <= r < 24 and 0 <= c < 32 and 32 * r + c not in bad]
+            self.neighbours[i, :len(valid)] = valid
+            if valid:
+                self.weights[i, :len(valid)] = 1.0 / len(valid)
+
+    def _vdd(self, frame):
+        resolution_ram = (int(frame[832]) & 0x0C00) >> 10
+        correction = 2.0 ** self.resolution_ee / 2.0 ** resolution_ram
+        return (correction * int(_signed(frame[810], 16)) - self.vdd25) / self.k_vdd + 3.3
+
+    def _ta(self, frame, vdd):
+        ptat = int(_signed(frame[800], 16))
+        ptat_art = int(_signed(frame[768], 16))
+        ptat_art = (ptat / (ptat * self.alpha_ptat + ptat_art)) * 2 ** 18
+        ta = ptat_art / (1 + self.kv_ptat * (vdd - 3.3)) - self.v_ptat25
+        return ta / self.kt_ptat + 25
+
+    def calculate(self, raw_frame, out, emissivity=0.95):
+        """
+        Compensate one raw subpage (834 words as sent in '#raw' lines) into
+        out, a 768-element float array holding the previous subpage's pixels.
+        Returns the subpage number.
+        """
+        frame = np.asarray(raw_frame, dtype=np.int64)
+        sub_page = int(frame[833])
+        vdd = self._vdd(frame)
+        ta = self._ta(frame, vdd)
+        tr = ta - OPENAIR_TA_SHIFT
+
+        ta4 = (ta + 273.15) ** 4
+        tr4 = (tr + 273.15) ** 4
+        ta_tr = tr4 - (tr4 - ta4) / emissivity
+
+        ks_to, ct = self.ks_to, self.ct
+        alpha_corr_r = np.empty(4)
+        alpha_corr_r[0] = 1 / (1 + ks_to[0] * 40)
+        alpha_corr_r[1] = 1
+        alpha_corr_r[2] = 1 + ks_to[1] * ct[2]
+        alpha_corr_r[3] = alpha_corr_r[2] * (1 + ks_to[2] * (ct[3] - ct[2]))
+
+        gain = self.gain_ee / int(_signed(frame[778], 16))
+        mode = (int(frame[832]) & 0x1000) >> 5
+
+        cp_factor = (1 + self.cp_kta * (ta - 25)) * (1 + self.cp_kv * (vdd - 3.3))
+        ir_data_cp = [
+            int(_signed(frame[776], 16)) * gain - self.cp_offset[0] * cp_factor,
+            int(_signed(frame[808], 16)) * gain - self.cp_offset[1] * cp_factor,
+        ]
+        if mode != self.calibration_mode_ee:
+            ir_data_cp[1] -= self.il_chess_c[0] * cp_factor
+
+        pattern = self.il_pattern if mode == 0 else self.chess_pattern
+        pixels = np.flatnonzero((pattern == sub_page) & self.good_pixels)
+
+        ir_data = _signed(frame[pixels], 16) * gain
+        ir_data = ir_data - self.offset[pixels] * (1 + self.kta[pixels] * (ta - 25)) * (1 + self.kv[pixels] * (vdd - 3.3))
+        if mode != self.calibration_mode_ee:
+            ir_data += (self.il_chess_c[2] * (2 * self.il_pattern[pixels] - 1)
+                        - self.il_chess_c[1] * self.conversion_pattern[pixels])
+        ir_data = (ir_data - self.tgc * ir_data_cp[sub_page]) / emissivity
+
+        alpha_compensated = self.alpha_inv[pixels] * (1 + self.ks_ta * (ta - 25))
+        sx = np.sqrt(np.sqrt(alpha_compensated ** 3 * (ir_data + alpha_compensated * ta_tr)))
+        to = np.sqrt(np.sqrt(ir_data / (alpha_compensated * (1 - ks_to[1] * 273.15) + sx) + ta_tr)) - 273.15
+
+        torange = np.digitize(to, ct[1:])
+        to = np.sqrt(np.sqrt(
+            ir_data / (alpha_compensated * alpha_corr_r[torange] * (1 + ks_to[torange] * (to - ct[torange])))
+            + ta_tr
+        )) - 273.15
+
+        out[pixels] = to
+        if self.bad_pixels.size:
+            out[self.bad_pixels] = (out[self.neighbours] * self.weights).sum(axis=1)
+        return sub_page
@@ -0,0 +1,123 @@
+"""
+Frames per second of colormap rendering: matplotlib's colormap call (as in
+thermal_cameras.apply_colormap) against thermal_render.ColormapLUT, for one
+camera and for a mosaic of many, and the whole imshow redraw either way.
+
+    python render_benchmark.py            # 16 cameras in the mosaic
+    python render_benchmark.py 64
+
+Drawing uses the Agg backend, so the numbers exclude the window system. A
+redraw costs the same whatever the image holds, so for one camera the LUT
+saves little there; with many cameras one mosaic image replaces an axes
+per camera.
+"""
+import sys
+import time
+
+import numpy as np
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.colors as mcolors  # noqa: E402
+import matplotlib.pyplot as plt  # noqa: E402
+
+from thermal_render import ColormapLUT, Mosaic  # noqa: E402
+
+VMIN, VMAX = 25.0, 32.0
+COLORS = [(0.0, 'black'), (0.2, 'darkred'), (0.3, 'red'), (0.4, 'orange'), (1.0, 'yellow')]
+
+
+def matplotlib_rgb(frame, cmap):
+    norm = np.clip((frame - VMIN) / (VMAX - VMIN), 0, 1)
+    return (cmap(norm)[..., :3] * 255).astype(np.uint8)
+
+
+def frames_per_second(render, frames, min_seconds=0.5):
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for frame in frames:
+            render(frame)
+        count += len(frames)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return count / elapsed
+
+
+def main():
+    cameras = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    rng = np.random.default_rng(0)
+    frames = [(24 + rng.normal(0, 2, (24, 32))).astype(np.float32) for _ in range(cameras)]
+    cmap = mcolors.LinearSegmentedColormap.from_list('heat', COLORS)
+    lut = ColormapLUT(cmap, VMIN, VMAX)
+
+    assert all(np.array_equal(lut.render(frame), matplotlib_rgb(frame, cmap)) for frame in frames)
+
+    print(f"{'path':<34}{'frames/s':>12}")
+    print(f"{'matplotlib colormap':<34}{frames_per_second(lambda f: matplotlib_rgb(f, cmap), frames):>12.0f}")
+    print(f"{'LUT (256 entries)':<34}{frames_per_second(lut.render, frames):>12.0f}")
+    lut1024 = ColormapLUT(cmap, VMIN, VMAX, size=1024)
+    print(f"{'LUT (1024 entries)':<34}{frames_per_second(lut1024.render, frames):>12.0f}")
+
+    # A mosaic frame counts every camera in it
+    mosaic = Mosaic(lut, cameras)
+
+    def matplotlib_mosaic(_):
+        for tile, frame in zip(mosaic.tiles, frames):
+            tile[...] = matplotlib_rgb(frame, cmap)
+
+    def lut_mosaic(_):
+        for k, frame in enumerate(frames):
+            mosaic.update(k, frame)
+
+    print(f"{f'mosaic of {cameras}, matplotlib':<34}"
+          f"{frames_per_second(matplotlib_mosaic, [None]) * cameras:>12.0f}")
+    print(f"{f'mosaic of {cameras}, LUT':<34}{frames_per_second(lut_mosaic, [None]) * cameras:>12.0f}")
+
+    # The viewers' redraw: colormapped by imshow, or RGB from the LUT
+    fig, ax = plt.subplots()
+    image = ax.imshow(frames[0], cmap=cmap, vmin=VMIN, vmax=VMAX)
+
+    def draw_colormapped(frame):
+        image.set_data(frame)
+        fig.canvas.draw()
+    print(f"{'imshow redraw, colormapped':<34}{frames_per_second(draw_colormapped, frames):>12.0f}")
+
+    fig, ax = plt.subplots()
+    image = ax.imshow(lut.render(frames[0]))
+
+    def draw_rgb(frame):
+        image.set_data(lut.render(frame))
+        fig.canvas.draw()
+    print(f"{'imshow redraw, LUT RGB':<34}{frames_per_second(draw_rgb, frames):>12.0f}")
+
+    # Many cameras: an axes per camera, or the mosaic as one image
+    fig, axes = plt.subplots(*_grid(cameras), squeeze=False)
+    images = [ax.imshow(frame, cmap=cmap, vmin=VMIN, vmax=VMAX)
+              for ax, frame in zip(axes.flat, frames)]
+
+    def draw_subplots(_):
+        for image, frame in zip(images, frames):
+            image.set_data(frame)
+        fig.canvas.draw()
+    print(f"{f'{cameras} subplots redraw':<34}"
+          f"{frames_per_second(draw_subplots, [None], 2) * cameras:>12.0f}")
+
+    fig, ax = plt.subplots()
+    image = ax.imshow(mosaic.canvas)
+
+    def draw_mosaic(_):
+        for k, frame in enumerate(frames):
+            mosaic.update(k, frame)
+        image.set_data(mosaic.canvas)
+        fig.canvas.draw()
+    print(f"{f'mosaic of {cameras} redraw':<34}{frames_per_second(draw_mosaic, [None]) * cameras:>12.0f}")
+
+
+def _grid(tiles):
+    columns = int(np.ceil(np.sqrt(tiles)))
+    return int(np.ceil(tiles / columns)), columns
+
+
+if __name__ == '__main__':
+    main()
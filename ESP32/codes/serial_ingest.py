@@ -0,0 +1,179 @@
+"""
+Read any number of wired ESP32 cameras (main_usb.py) concurrently.
+
+SerialIngest finds ESP32 USB-serial ports by their bridge chips' VID:PID,
+reads each one in large non-blocking chunks into its own LineAssembler and
+FrameDecoder, and puts every decoded frame on one shared asyncio.Queue as
+(port, sensor, frame). A port that fails or disappears is reopened with its
+own exponential backoff while the other ports keep streaming.
+
+    ingest = SerialIngest()
+    asyncio.create_task(ingest.run())
+    port, sensor, frame = await ingest.frames.get()
+
+When the queue is full the oldest frame is dropped, so a slow consumer sees
+recent frames rather than a growing delay.
+"""
+import asyncio
+
+import serial
+from serial.tools import list_ports
+
+import thermal_stream
+
+BAUD_RATE = 115200
+
+# USB-serial bridges found on ESP32 boards: CP210x, CH340, CH9102, FTDI and
+# the ESP32-S2/S3/C3 built-in USB
+ESP32_USB_IDS = {
+    (0x10C4, 0xEA60),
+    (0x1A86, 0x7523),
+    (0x1A86, 0x55D4),
+    (0x0403, 0x6001),
+    (0x303A, 0x1001),
+}
+
+READ_SIZE = 4096  # bytes per read, several CSV frames
+POLL_INTERVAL = 0.005  # seconds between reads where ports cannot be watched
+RESCAN_INTERVAL = 2.0  # seconds between looks for newly plugged cameras
+BACKOFF_START = 0.5
+BACKOFF_MAX = 8.0
+
+
+def discover_ports():
+    """Device names of the connected ESP32 USB-serial ports."""
+    return sorted(port.device for port in list_ports.comports()
+                  if (port.vid, port.pid) in ESP32_USB_IDS)
+
+
+class PortReader:
+    """One serial port: its own line assembly, decoder state and backoff."""
+
+    def __init__(self, port, frames, recorder=None):
+        self.port = port
+        self.frames = frames
+        self.recorder = recorder
+        self.assembler = thermal_stream.LineAssembler()
+        self.decoder = thermal_stream.FrameDecoder()
+        self.serial = None
+        self.bad_lines = 0
+        self.reconnects = 0
+
+    async def run(self):
+        backoff = BACKOFF_START
+        while True:
+            try:
+                self.serial = serial.Serial(self.port, BAUD_RATE, timeout=0)
+            except serial.SerialException as e:
+                print(f"⚠️ {self.port}: {e}. Retrying in {backoff:.1f} s...")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, BACKOFF_MAX)
+                continue
+
+            print(f"Reading {self.port}")
+            backoff = BACKOFF_START
+            # A line cut off by the disconnect must not prefix the next one
+            self.assembler.clear()
+            try:
+                await self._read_loop()
+            except (serial.SerialException, OSError) as e:
+                print(f"⚠️ {self.port}: connection lost ({e}). Reconnecting...")
+                self.reconnects += 1
+            finally:
+                self.serial.close()
+                self.serial = None
+
+    async def _read_loop(self):
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        try:
+            # Wake up when the port has data (POSIX); otherwise poll
+            loop.add_reader(self.serial.fileno(), ready.set)
+            watched = True
+        except (NotImplementedError, AttributeError, ValueError):
+            watched = False
+        try:
+            while True:
+                if watched:
+                    await ready.wait()
+                    ready.clear()
+                # pyserial raises SerialException once the device is gone
+                data = self.serial.read(max(self.serial.in_waiting, READ_SIZE))
+                if data:
+                    self._feed(data)
+                elif not watched:
+                    await asyncio.sleep(POLL_INTERVAL)
+        finally:
+            if watched:
+                loop.remove_reader(self.serial.fileno())
+
+    def _feed(self, data):
+        for item in self.decode(data):
+            self.put_latest(item)
+
+    def decode(self, data):
+        """The (port, sensor, frame) items of the lines data completes."""
+        for line in self.assembler.feed(data):
+            if self.recorder:
+                self.recorder.record(self.port, line)
+            try:
+                sensor, frame = self.decoder.decode_line(line)
+            except ValueError:
+                self.bad_lines += 1
+                continue
+            if frame is not None:
+                yield self.port, sensor, frame
+
+    def put_latest(self, item):
+        """Queue item, dropping the oldest one when the queue is full."""
+        frames = self.frames
+        if frames.full():
+            frames.get_nowait()  # drop the oldest
+        frames.put_nowait(item)
+
+    def send(self, line):
+        """Write a command line (thermal_stream.command_line) to the device."""
+        if self.serial is None:
+            raise serial.SerialException(f"{self.port} is not connected")
+        self.serial.write(line)
+
+
+class SerialIngest:
+    def __init__(self, ports=None, queue_size=64, recorder=None):
+        """ports: device names to read; None discovers ESP32 ports, also ones
+        plugged in later. recorder: a stream_log.StreamRecorder that logs
+        every received line."""
+        self.ports = ports
+        self.recorder = recorder
+        self.frames = asyncio.Queue(queue_size)
+        self.readers = {}  # port -> PortReader
+        self._tasks = []
+
+    def _start(self, port):
+        reader = PortReader(port, self.frames, self.recorder)
+        self.readers[port] = reader
+        self._tasks.append(asyncio.create_task(reader.run()))
+
+    async def run(self):
+        """Read until cancelled."""
+        try:
+            if self.ports is not None:
+                for port in self.ports:
+                    self._start(port)
+                await asyncio.gather(*self._tasks)
+            while True:
+                for port in discover_ports():
+                    if port not in self.readers:
+                        self._start(port)
+                await asyncio.sleep(RESCAN_INTERVAL)
+        finally:
+            for task in self._tasks:
+                task.cancel()
+
+    def decoder(self, port):
+        """The FrameDecoder of a port, for its sideband state (stats, counts,
+        command replies)."""
+        return self.readers[port].decoder
+
+    def send(self, port, line):
+        self.readers[port].send(line)
@@ -0,0 +1,246 @@
+"""
+Record everything the cameras send and replay it later.
+
+StreamRecorder appends every received protocol line (frames and sideband
+alike, so '#roi', '#ee' and '#pack' state replays faithfully) with its
+device id, a per-device sequence number and the receive time to a log of
+zlib-compressed chunks. Each chunk stands alone, so a recording cut short
+by a crash loses at most its last chunk, and reading skips a corrupt chunk
+and carries on with the next.
+
+ReplayIngest reads a log back through the same API as
+serial_ingest.SerialIngest (frames queue of (port, sensor, frame), run(),
+decoder()), either at the recorded pace or as fast as the consumer takes
+frames, which then loses none.
+
+    python stream_log.py record capture.tlog               # all ESP32 ports
+    python stream_log.py record capture.tlog /dev/ttyUSB0
+    python stream_log.py replay capture.tlog [--fast]      # frames/s report
+
+Chunk layout: b'TLOG', uint32 payload length, uint32 compressed length, then
+zlib(payload). The payload is the chunk's device names as a JSON list and a
+newline, then per line: uint16 device index, uint32 sequence, float64 unix
+time, uint16 length, the line without its newline.
+"""
+import asyncio
+import json
+import struct
+import sys
+import time
+import zlib
+
+from serial_ingest import PortReader
+
+CHUNK_MAGIC = b'TLOG'
+CHUNK_HEADER = struct.Struct('<4sII')
+RECORD_HEADER = struct.Struct('<HIdH')
+CHUNK_LINES = 512  # lines per chunk
+CHUNK_SECONDS = 5.0  # a chunk is written at least this often
+RESYNC_BLOCK = 64 * 1024  # bytes read at a time when looking past a bad chunk
+
+
+class StreamRecorder:
+    def __init__(self, path, chunk_lines=CHUNK_LINES, chunk_seconds=CHUNK_SECONDS):
+        self.file = open(path, 'ab')
+        self.chunk_lines = chunk_lines
+        self.chunk_seconds = chunk_seconds
+        self.sequence = {}  # device -> next sequence number
+        self.lines = 0  # recorded so far
+        self._start_chunk()
+
+    def _start_chunk(self):
+        self._devices = {}  # device -> index in this chunk
+        self._records = bytearray()
+        self._count = 0
+        self._started = time.monotonic()
+
+    def record(self, device, line, timestamp=None):
+        """Append one received line (bytes, without '\\n') from device."""
+        index = self._devices.setdefault(device, len(self._devices))
+        sequence = self.sequence.get(device, 0)
+        self.sequence[device] = sequence + 1
+        if timestamp is None:
+            timestamp = time.time()
+        self._records += RECORD_HEADER.pack(index, sequence, timestamp, len(line))
+        self._records += line
+        self._count += 1
+        self.lines += 1
+        if (self._count >= self.chunk_lines
+                or time.monotonic() - self._started >= self.chunk_seconds):
+            self.flush()
+
+    def flush(self):
+        """Write the open chunk."""
+        if not self._count:
+            return
+        payload = json.dumps(list(self._devices)).encode() + b'\n' + self._records
+        compressed = zlib.compress(payload)
+        self.file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, len(payload), len(compressed)))
+        self.file.write(compressed)
+        self.file.flush()
+        self._start_chunk()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_log(path):
+    """Yield (device, sequence, timestamp, line) in recorded order. A corrupt
+    chunk is skipped up to the next chunk magic; a truncated last chunk ends
+    the log."""
+    with open(path, 'rb') as f:
+        while True:
+            start = f.tell()
+            header = f.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                return
+            magic, size, compressed_size = CHUNK_HEADER.unpack(header)
+            records = None
+            if magic == CHUNK_MAGIC:
+                compressed = f.read(compressed_size)
+                if len(compressed) == compressed_size:
+                    records = _parse_chunk(compressed, size)
+            if records is None:
+                # Corrupt (or cut short): look for the next chunk after it
+                if not _resync(f, start + 1):
+                    return
+                print(f"⚠️ {path}: skipped a corrupt chunk at byte {start}")
+                continue
+            yield from records
+
+
+def _parse_chunk(compressed, size):
+    """The chunk's records, or None if it does not decode."""
+    try:
+        payload = zlib.decompress(compressed)
+        if len(payload) != size:
+            return None
+        names_end = payload.index(b'\n')
+        devices = json.loads(payload[:names_end])
+        records = []
+        pos = names_end + 1
+        while pos < len(payload):
+            index, sequence, timestamp, length = RECORD_HEADER.unpack_from(payload, pos)
+            pos += RECORD_HEADER.size
+            if pos + length > len(payload):
+                return None
+            records.append((devices[index], sequence, timestamp, payload[pos:pos + length]))
+            pos += length
+        return records
+    except (zlib.error, ValueError, IndexError, struct.error):
+        return None
+
+
+def _resync(f, pos):
+    """Seek to the first chunk magic at or after pos; False if there is none."""
+    f.seek(pos)
+    tail = b''
+    while True:
+        block = f.read(RESYNC_BLOCK)
+        if not block:
+            return False
+        data = tail + block
+        found = data.find(CHUNK_MAGIC)
+        if found >= 0:
+            f.seek(pos - len(tail) + found)
+            return True
+        # Keep the end in case the magic straddles two blocks
+        tail = data[-(len(CHUNK_MAGIC) - 1):]
+        pos += len(block)
+
+
+class ReplayIngest:
+    def __init__(self, path, speed=1.0, queue_size=64):
+        """speed: multiple of the recorded pace; None replays as fast as the
+        frames are taken from the queue."""
+        self.path = path
+        self.speed = speed
+        self.frames = asyncio.Queue(queue_size)
+        self.readers = {}  # device -> PortReader, decoding as when recorded
+        # Sequence numbers missing from the log. The recorder numbers every
+        # line it is given, so these are lines lost with skipped corrupt
+        # chunks, not lines lost on the wire.
+        self.gaps = 0
+        self.done = False
+
+    async def run(self):
+        """Replay the whole log, then return."""
+        sequence = {}
+        start = first = None
+        for device, seq, timestamp, line in read_log(self.path):
+            reader = self.readers.get(device)
+            if reader is None:
+                reader = self.readers[device] = PortReader(device, self.frames)
+            if device in sequence and seq != sequence[device] + 1:
+                self.gaps += 1
+            sequence[device] = seq
+
+            if self.speed:
+                if start is None:
+                    start, first = time.monotonic(), timestamp
+                delay = (timestamp - first) / self.speed - (time.monotonic() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                for item in reader.decode(line + b'\n'):
+                    reader.put_latest(item)  # like a live port
+            else:
+                for item in reader.decode(line + b'\n'):
+                    await self.frames.put(item)
+        self.done = True
+
+    def decoder(self, device):
+        return self.readers[device].decoder
+
+
+async def _record(path, ports):
+    from serial_ingest import SerialIngest
+
+    with StreamRecorder(path) as recorder:
+        ingest = SerialIngest(ports or None, recorder=recorder)
+        reading = asyncio.create_task(ingest.run())
+        frames = 0
+        try:
+            while True:
+                await ingest.frames.get()
+                frames += 1
+                if frames % 100 == 0:
+                    print(f"{recorder.lines} lines, {frames} frames recorded")
+        finally:
+            reading.cancel()
+
+
+async def _replay(path, fast):
+    replay = ReplayIngest(path, speed=None if fast else 1.0)
+    replaying = asyncio.create_task(replay.run())
+    frames = 0
+    start = time.perf_counter()
+    while not (replaying.done() and replay.frames.empty()):
+        try:
+            await asyncio.wait_for(replay.frames.get(), 0.5)
+        except asyncio.TimeoutError:
+            continue
+        frames += 1
+    await replaying
+    elapsed = time.perf_counter() - start
+    bad = sum(reader.bad_lines for reader in replay.readers.values())
+    print(f"{frames} frames from {len(replay.readers)} device(s) in {elapsed:.2f} s "
+          f"({frames / elapsed:.0f} frames/s), {bad} bad lines, {replay.gaps} sequence gaps")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in ('record', 'replay'):
+        sys.exit(__doc__)
+    if sys.argv[1] == 'record':
+        try:
+            asyncio.run(_record(sys.argv[2], sys.argv[3:]))
+        except KeyboardInterrupt:
+            pass
+    else:
+        asyncio.run(_replay(sys.argv[2], '--fast' in sys.argv[3:]))
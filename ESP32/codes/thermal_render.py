@@ -0,0 +1,82 @@
+"""
+Colormap rendering for live thermal display.
+
+matplotlib normalizes every frame, evaluates the colormap and converts its
+RGBA floats each time a frame is drawn. ColormapLUT does that once per
+colormap: it keeps a uint8 RGB table of `size` entries, and rendering a frame
+is one scale into a reused index buffer and one gather from the table into a
+reused RGB buffer. With size=256 (a colormap's default resolution) the result
+is identical to (cmap(norm(frame))[..., :3] * 255).astype(np.uint8).
+
+Mosaic tiles the frames of many cameras into one RGB canvas, each camera
+rendering straight into its own view of it.
+
+render_benchmark.py compares both with the matplotlib path.
+"""
+import math
+
+import numpy as np
+import matplotlib.colors as mcolors
+
+FRAME_SHAPE = (24, 32)
+
+
+class ColormapLUT:
+    def __init__(self, cmap, vmin, vmax, size=256, shape=FRAME_SHAPE):
+        """cmap: a matplotlib colormap, or the (position, colour) stops of one
+        as used throughout the viewers."""
+        if not isinstance(cmap, mcolors.Colormap):
+            cmap = mcolors.LinearSegmentedColormap.from_list('heat', cmap)
+        self.cmap = cmap
+        self.size = size
+        self.table = (cmap(np.linspace(0, 1, size))[:, :3] * 255).astype(np.uint8)
+        self.set_range(vmin, vmax)
+        self._scaled = np.empty(shape, dtype=np.float32)
+        self._index = np.empty(shape, dtype=np.intp)
+        self.image = np.empty(shape + (3,), dtype=np.uint8)
+
+    def set_range(self, vmin, vmax):
+        """Temperatures mapped to the first and the last colour."""
+        self.vmin = vmin
+        self.vmax = vmax
+        self._scale = self.size / (vmax - vmin)
+
+    def render(self, frame, out=None):
+        """RGB uint8 image of a (24, 32) frame, in out (any (24, 32, 3) uint8
+        array or view) or in self.image, which the next call reuses.
+        Temperatures outside [vmin, vmax] take the end colours; NaN pixels
+        (outside an ROI) the first one."""
+        scaled, index = self._scaled, self._index
+        np.subtract(frame, self.vmin, out=scaled)
+        np.multiply(scaled, self._scale, out=scaled)
+        # fmax also turns NaN into 0
+        np.fmax(scaled, 0, out=scaled)
+        np.fmin(scaled, self.size - 1, out=scaled)
+        index[...] = scaled
+        if out is None:
+            out = self.image
+        # 'clip' writes straight into out, even a non-contiguous view
+        np.take(self.table, index, axis=0, out=out, mode='clip')
+        return out
+
+
+class Mosaic:
+    """Tiles of several (24, 32) frames in one RGB canvas."""
+
+    def __init__(self, lut, tiles, columns=None, gap=1, shape=FRAME_SHAPE):
+        self.lut = lut
+        columns = columns or math.ceil(math.sqrt(tiles))
+        rows = math.ceil(tiles / columns)
+        height, width = shape
+        self.canvas = np.zeros((rows * (height + gap) - gap, columns * (width + gap) - gap, 3),
+                               dtype=np.uint8)
+        self.tiles = []
+        for k in range(tiles):
+            top = (k // columns) * (height + gap)
+            left = (k % columns) * (width + gap)
+            self.tiles.append(self.canvas[top:top + height, left:left + width])
+
+    def update(self, tile, frame):
+        """Render frame into its tile; returns the canvas."""
+        self.lut.render(frame, out=self.tiles[tile])
+        return self.canvas
@@ -0,0 +1,243 @@
+"""
+Host-side decoder for the line protocol streamed by the ESP32 firmware
+(main_usb.py over serial, main_ble.py over BLE notifications).
+
+Every message is one '\\n'-terminated line:
+  - data lines are comma separated temperatures. A full frame has 768 values;
+    an ROI-shaped frame has one value per pixel of the last announced ROI.
+  - lines starting with '#' are sideband messages. '#roi,<hex>' announces the
+    ROI as a 96-byte bitmap (pixel p is bit p & 7 of byte p >> 3).
+  - in raw mode the device sends '#serial,<w0>,<w1>,<w2>' and '#ee,<base64>'
+    (832 little-endian EEPROM words) first, then '#raw,<base64>' subpages
+    (834 words) that are calibrated here with mlx_calibration.
+  - '#delta,<p>,<t>,<p>,<t>,...' sets only the listed pixels p (0..767) of
+    the sensor's last frame to temperatures t; with change detection on, the
+    firmware sends those (or nothing) while the scene is still, and a full
+    keyframe at least every few seconds.
+  - '#pack,<base64>' is a frame (or the ROI pixels) coded with
+    Files-ESP32/thermal_codec.py, delta coded against the sensor's previous
+    '#pack' frame.
+  - '#timing,<cycle_ms>,<busy_ms>,<slack_ms>,<skipped>' reports the USB
+    firmware's capture loop timing after every cycle.
+  - '#heap,<free>,<largest_free>,<collections>,<last_gc_ms>,<max_gc_ms>,
+    <memory_errors>' reports the firmware's heap every few seconds.
+  - '#backlog,<age_ms>,<left>' precedes a frame the BLE firmware recorded
+    while no host was connected; frame_age_ms tells how old each frame is.
+  - '#stats,<name>=<value>,...' carries the firmware's performance counters
+    (Files-ESP32/telemetry.py); main_ble.py serves the same record on its
+    telemetry characteristic, see parse_telemetry().
+  - '#count,<people>,<foreground pixels>' is a people count from the ESP32
+    (count mode), sent when it changes and every few seconds.
+  - '#throughput,<chunk>,<pacing_ms>,<bytes>,<ms>,<refused>' ends one set
+    of the BLE self-test (Files-ESP32/ble_link.py), whose '#fill,...' lines
+    are counted here; see throughput.
+  - '#ok,<command>' and '#error,<command>,<reason>' answer host commands
+    (see command_line()); '#error,capture,<reason>' means the firmware's
+    capture thread stopped on an error.
+  - with several sensors on one ESP32, every line carries a '<sensor>:'
+    prefix; untagged lines belong to sensor 0.
+"""
+import base64
+import os
+import struct
+import sys
+
+import numpy as np
+
+from mlx_calibration import MLX90640Calibration
+
+# thermal_codec runs on the ESP32 too and lives with the firmware. Appended,
+# so the firmware's typing.py stub does not shadow the standard library.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Files-ESP32'))
+import telemetry  # noqa: E402
+import thermal_codec  # noqa: E402
+
+FRAME_SHAPE = (24, 32)
+FRAME_PIXELS = 768
+
+
+def parse_roi_mask(mask_hex):
+    """Return the pixel indices selected by a hex-encoded ROI bitmap."""
+    mask = np.frombuffer(bytes.fromhex(mask_hex), dtype=np.uint8)
+    if mask.size != FRAME_PIXELS // 8:
+        raise ValueError(f"ROI mask has {mask.size} bytes, expected {FRAME_PIXELS // 8}")
+    return np.flatnonzero(np.unpackbits(mask, bitorder='little'))
+
+
+def format_roi_mask(pixels):
+    """Hex-encode the ROI bitmap of pixel indices, for the 'roi' command."""
+    mask = np.zeros(FRAME_PIXELS, dtype=np.uint8)
+    mask[np.asarray(pixels)] = 1
+    return np.packbits(mask, bitorder='little').tobytes().hex()
+
+
+def parse_telemetry(data):
+    """Decode the BLE telemetry characteristic into {field: value}."""
+    return dict(zip(telemetry.FIELDS, struct.unpack(telemetry.PACK_FORMAT, bytes(data))))
+
+
+def command_line(name, *args):
+    """Encode a command for the firmware, e.g. command_line('frames', 30) or
+    command_line('encoding', 'pack', 5), to write to the serial port or the
+    BLE characteristic. The commands are listed in command_channel.py."""
+    return ','.join([name, *map(str, args)]).encode() + b'\n'
+
+
+class LineAssembler:
+    """Reassemble lines from arbitrarily chunked bytes (e.g. BLE notifications)."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Append a chunk and return the list of complete lines it finished."""
+        self._buffer.extend(data)
+        *lines, rest = self._buffer.split(b'\n')
+        self._buffer = bytearray(rest)
+        return [bytes(line) for line in lines if line.strip()]
+
+    def clear(self):
+        self._buffer = bytearray()
+
+
+def decode_words(payload):
+    """Decode a base64 payload of little-endian 16-bit words."""
+    return np.frombuffer(base64.b64decode(payload), dtype='<u2')
+
+
+def split_tag(line):
+    """Split a protocol line into (sensor index, payload)."""
+    head, sep, rest = line.partition(':')
+    if sep and head.isdigit():
+        return int(head), rest
+    return 0, line
+
+
+class FrameDecoder:
+    """
+    Turn protocol lines into (24, 32) float frames.
+    Pixels outside the active ROI are NaN, which matplotlib leaves blank and
+    np.nanmean ignores.
+    """
+
+    def __init__(self):
+        self.roi = {}  # sensor index -> pixel indices of its announced ROI
+        self.serial = {}  # sensor index -> serial number words (raw mode)
+        self.calibration = {}  # sensor index -> MLX90640Calibration (raw mode)
+        self._raw_frames = {}  # sensor index -> frame both subpages merge into
+        self._ee_payload = {}
+        self._frames = {}  # sensor index -> last frame, what '#delta' updates
+        self._unpackers = {}  # sensor index -> thermal_codec.Decoder
+        self.timing = None  # last (cycle_ms, busy_ms, slack_ms, skipped)
+        self.heap = None  # last '#heap' fields, see the module docstring
+        self.count = {}  # sensor index -> (people, foreground pixels)
+        self.frame_age_ms = {}  # sensor index -> age of its last frame (0 if live)
+        self.backlog_left = 0
+        self.stats = {}  # last '#stats' counters by name
+        self._backlog_age = None
+        self.replies = []  # (command, error or None) answers, oldest first
+        self.throughput = []  # one dict per self-test set, oldest first
+        self._fill_bytes = 0
+
+    def decode_line(self, line):
+        """
+        Decode one line into (sensor, frame). The frame is None for sideband
+        lines; corrupted or incomplete data raises ValueError.
+        """
+        if isinstance(line, (bytes, bytearray)):
+            line = line.decode()  # UnicodeDecodeError is a ValueError
+        sensor, line = split_tag(line.strip())
+
+        if line.startswith('#') and not line.startswith(('#raw,', '#delta,', '#pack,')):
+            self._handle_sideband(sensor, line[1:].split(','))
+            return sensor, None
+
+        # A frame: recorded offline if a '#backlog' line came right before
+        age, self._backlog_age = self._backlog_age, None
+        frame = self._decode_frame(sensor, line)
+        self.frame_age_ms[sensor] = age or 0
+        return sensor, frame
+
+    def _decode_frame(self, sensor, line):
+        if line.startswith('#raw,'):
+            return self._calibrate_raw(sensor, line[5:])
+
+        if line.startswith('#delta,'):
+            return self._apply_delta(sensor, line[7:])
+
+        if line.startswith('#pack,'):
+            unpacker = self._unpackers.setdefault(sensor, thermal_codec.Decoder())
+            values = np.asarray(unpacker.decode(base64.b64decode(line[6:])), dtype=np.float32) / 100
+            return self._frame_from_values(sensor, values)
+
+        return self._frame_from_values(sensor, np.fromstring(line, sep=',', dtype=np.float32))
+
+    def _frame_from_values(self, sensor, values):
+        """Place the values of a full or ROI-shaped frame."""
+        roi = self.roi.get(sensor)
+        if values.size == FRAME_PIXELS:
+            frame = values
+        elif roi is not None and values.size == roi.size:
+            frame = np.full(FRAME_PIXELS, np.nan, dtype=np.float32)
+            frame[roi] = values
+        else:
+            raise ValueError(f"Frame has {values.size} values")
+        self._frames[sensor] = frame
+        return frame.reshape(FRAME_SHAPE).copy()
+
+    def _apply_delta(self, sensor, payload):
+        frame = self._frames.get(sensor)
+        if frame is None:
+            raise ValueError("Delta before the first keyframe")
+        fields = np.fromstring(payload, sep=',', dtype=np.float64)
+        if fields.size % 2:
+            raise ValueError("Delta has an odd number of fields")
+        pixels = fields[0::2].astype(np.intp)
+        if pixels.size and (pixels.min() < 0 or pixels.max() >= FRAME_PIXELS):
+            raise ValueError("Delta pixel out of range")
+        frame[pixels] = fields[1::2]
+        return frame.reshape(FRAME_SHAPE).copy()
+
+    def _calibrate_raw(self, sensor, payload):
+        calibration = self.calibration.get(sensor)
+        if calibration is None:
+            raise ValueError("Raw frame before the EEPROM handshake")
+        raw = decode_words(payload)
+        if raw.size != 834:
+            raise ValueError(f"Raw frame has {raw.size} words")
+        frame = self._raw_frames.setdefault(sensor, np.zeros(FRAME_PIXELS, dtype=np.float32))
+        calibration.calculate(raw, frame)
+        return frame.reshape(FRAME_SHAPE).copy()
+
+    def _handle_sideband(self, sensor, fields):
+        if fields[0] == 'roi':
+            self.roi[sensor] = parse_roi_mask(fields[1])
+        elif fields[0] == 'serial':
+            self.serial[sensor] = tuple(int(word, 16) for word in fields[1:4])
+        elif fields[0] == 'timing':
+            self.timing = tuple(int(value) for value in fields[1:5])
+        elif fields[0] == 'stats':
+            self.stats = {name: int(value) for name, value in (field.split('=') for field in fields[1:])}
+        elif fields[0] == 'backlog':
+            self._backlog_age = int(fields[1])
+            self.backlog_left = int(fields[2])
+        elif fields[0] == 'count':
+            self.count[sensor] = (int(fields[1]), int(fields[2]))
+        elif fields[0] == 'fill':
+            self._fill_bytes += len(fields[1]) + len('#fill,\n')
+        elif fields[0] == 'throughput':
+            chunk, pacing_ms, sent, elapsed_ms, refused = (int(value) for value in fields[1:6])
+            self.throughput.append({
+                'chunk': chunk, 'pacing_ms': pacing_ms, 'sent': sent, 'refused': refused,
+                'received': self._fill_bytes,
+                'bytes_per_s': self._fill_bytes * 1000 / max(elapsed_ms, 1),
+            })
+            self._fill_bytes = 0
+        elif fields[0] in ('ok', 'error'):
+            self.replies.append((fields[1], ','.join(fields[2:]) if fields[0] == 'error' else None))
+        elif fields[0] == 'heap':
+            self.heap = tuple(int(value) for value in fields[1:7])
+        elif fields[0] == 'ee' and self._ee_payload.get(sensor) != fields[1]:
+            # The handshake repeats for late listeners; only rebuild on change
+            self.calibration[sensor] = MLX90640Calibration(decode_words(fields[1]))
+            self._ee_payload[sensor] = fields[1]
@@ -3,10 +3,15 @@ from bleak import BleakClient, BleakScanner
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+import thermal_stream
+from thermal_render import ColormapLUT
+from stream_log import StreamRecorder
 
 DEVICE_NAME = "ESP32-BLE"
 SERVICE_UUID = "12345678-1234-5678-1234-56789abcdef0"
 CHARACTERISTIC_UUID = "12345678-1234-5678-1234-56789abcdef1"
+SENSOR = 0  # which sensor to show when the ESP32 streams several
+RECORD_TO = None  # e.g. "capture.tlog": log every line for stream_log.py replay
 
 # Custom colormap
 colors = [
@@ -18,47 +23,37 @@ colors = [
     (1.0, 'yellow'),
 ]
 cmap = mcolors.LinearSegmentedColormap.from_list('heat', colors)
+# Frames are colored through a lookup table (thermal_render.py)
+lut = ColormapLUT(cmap, vmin=25, vmax=32)
 
 # Plot setup
 fig, ax = plt.subplots()
-img = ax.imshow(np.zeros((24,32)), cmap=cmap, vmin=25, vmax=32)
-plt.colorbar(img, ax=ax)
+img = ax.imshow(lut.render(np.zeros((24,32))))
+plt.colorbar(plt.cm.ScalarMappable(mcolors.Normalize(25, 32), cmap), ax=ax)
 plt.title("Live MLX90640 BLE frame")
 plt.ion()
 plt.show()
 
-# Buffer to accumulate received data
-frame_buffer = bytearray()
-
-def clear_buffer():
-    global frame_buffer
-    frame_buffer = bytearray()
+# Reassembles notification chunks into protocol lines
+assembler = thermal_stream.LineAssembler()
+recorder = RECORD_TO and StreamRecorder(RECORD_TO)
+decoder = thermal_stream.FrameDecoder()
 
 async def notification_handler(sender, data):
-    global frame_buffer
-
-    # Accumulate incoming chunks
-    frame_buffer.extend(data)
-
-    # Check if a complete frame is received (768 floats, 767 commas)
-    if frame_buffer.count(b',') >= 767:
+    # Accumulate incoming chunks; a frame is complete at its newline
+    for line in assembler.feed(data):
+        if recorder:
+            recorder.record(DEVICE_NAME, line)
         try:
-            # Convert buffer to numpy array
-            frame_str = frame_buffer.decode()
-            values = np.fromstring(frame_str, sep=',')
-
-            if values.size == 768:
-                # Successfully received full frame; visualize
-                img.set_data(values.reshape(24,32))
-                plt.pause(0.001)
-            else:
-                print("⚠️ Incomplete frame received, skipping.")
-
-        except UnicodeDecodeError:
-            print("⚠️ Decode error, corrupted data. Skipping frame.")
+            sensor, frame = decoder.decode_line(line)
+        except ValueError:
+            print("⚠️ Incomplete or corrupted frame received, skipping.")
+            continue
 
-        # Always clear buffer after handling
-        clear_buffer()
+        if frame is not None and sensor == SENSOR:
+            # Successfully received full frame; visualize
+            img.set_data(lut.render(frame))
+            plt.pause(0.001)
 
 async def connect_and_receive():
     while True:
@@ -92,4 +87,8 @@ async def connect_and_receive():
 
 
 if __name__ == "__main__":
-    asyncio.run(connect_and_receive())
+    try:
+        asyncio.run(connect_and_receive())
+    finally:
+        if recorder:
+            recorder.close()
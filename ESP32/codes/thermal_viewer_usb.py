@@ -1,9 +1,13 @@
-import serial, numpy as np, matplotlib.pyplot as plt
+import asyncio
+import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+from serial_ingest import SerialIngest
+from thermal_render import ColormapLUT, Mosaic
 
-# Serial connection setup
-PORT = '/dev/cu.usbserial-0001'  # adjust if different
-ser = serial.Serial(PORT, 115200, timeout=None)
+# Serial connection setup: every ESP32 plugged in is read (serial_ingest.py)
+# and each of its sensors gets a tile of the mosaic. Set PORTS to read only
+# those ports.
+PORTS = None  # e.g. ['/dev/cu.usbserial-0001']
 
 # Custom colormap
 colors = [
@@ -14,38 +18,41 @@ colors = [
     (1.0, 'yellow'),
 ]
 cmap = mcolors.LinearSegmentedColormap.from_list('heat', colors)
+# Frames are colored through a lookup table (thermal_render.py); matplotlib
+# only draws the finished RGB mosaic
+lut = ColormapLUT(cmap, vmin=25, vmax=32)
 
 # Plot setup
 fig, ax = plt.subplots()
-img = ax.imshow(np.zeros((24,32)), cmap=cmap, vmin=25, vmax=32)
-plt.colorbar(img, ax=ax)
-plt.title("Live MLX90640 frame")
+mosaic = Mosaic(lut, 1)
+img = ax.imshow(mosaic.canvas)
+plt.colorbar(plt.cm.ScalarMappable(mcolors.Normalize(25, 32), cmap), ax=ax)
+plt.title("Live MLX90640 frames")
 plt.ion()
 plt.show()
 
-# Main loop with reset handling
-while True:
+async def main():
+    global mosaic
+    ingest = SerialIngest(PORTS)
+    reading = asyncio.create_task(ingest.run())
+    tiles = {}  # (port, sensor) -> mosaic tile, in order of appearance
     try:
-        line = ser.readline().decode().strip()
-        if not line:
-            continue  # timeout or empty line
-        values = np.fromstring(line, sep=',')
-        if values.size != 768:
-            print("⚠️ Bad frame, skipping")
-            continue
+        while True:
+            # Ports reconnect on their own; bad lines are skipped per port
+            port, sensor, frame = await ingest.frames.get()
+            tile = tiles.get((port, sensor))
+            if tile is None:
+                # A new camera: make room for it
+                tile = tiles[port, sensor] = len(tiles)
+                mosaic = Mosaic(lut, len(tiles))
+                height, width, _ = mosaic.canvas.shape
+                img.set_extent((-0.5, width - 0.5, height - 0.5, -0.5))
+                print(f"Showing {port} sensor {sensor}")
 
-        img.set_data(values.reshape(24,32))
-        plt.pause(0.001)
+            img.set_data(mosaic.update(tile, frame))
+            plt.pause(0.001)
+    finally:
+        reading.cancel()
 
-    except (serial.SerialException, UnicodeDecodeError) as e:
-        print(f"⚠️ Serial connection lost ({e}). Waiting for reconnection...")
-        ser.close()
-        connected = False
-        # Try reconnecting until it succeeds
-        while not connected:
-            try:
-                ser = serial.Serial(PORT, 115200, timeout=None)
-                connected = True
-                print("Serial connection restored!")
-            except serial.SerialException:
-                plt.pause(0.5)  # Wait a bit before retrying
+
+asyncio.run(main())
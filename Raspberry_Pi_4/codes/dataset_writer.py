@@ -0,0 +1,80 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class DatasetWriter:
+    """
+    Save dataset frames on a pool of worker threads.
+    The capture loop hands each frame to submit() and goes back to the sensor;
+    the workers run save(filename, frame) (PNG encoding, np.save, ...) in
+    parallel. The queue is bounded: when the workers fall behind, submit()
+    waits for a free slot rather than dropping frames or growing without
+    limit, and the time spent waiting is counted in the stats.
+    """
+
+    def __init__(self, save, workers=2, queue_size=16):
+        self.save = save
+        self.queue = queue.Queue(queue_size)
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.waits = 0  # submits that found the queue full
+        self.wait_seconds = 0.0
+        self.peak_depth = 0
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"dataset-writer-{k}", daemon=True)
+            for k in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, filename, frame):
+        """Queue a frame for saving; blocks only while the queue is full."""
+        # The copy leaves the caller free to reuse its buffer
+        item = (filename, np.array(frame, copy=True))
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            start = time.perf_counter()
+            self.queue.put(item)
+            self.waits += 1
+            self.wait_seconds += time.perf_counter() - start
+        self.submitted += 1
+        self.peak_depth = max(self.peak_depth, self.queue.qsize())
+
+    def close(self):
+        """Wait for every queued frame to be saved and stop the workers."""
+        for _ in self._workers:
+            self.queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def stats(self):
+        return (f"{self.written}/{self.submitted} frames saved, {self.failed} failed, "
+                f"capture waited {self.waits} times ({self.wait_seconds:.2f} s) "
+                f"on a full queue, peak queue depth {self.peak_depth}/{self.queue.maxsize}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            filename, frame = item
+            try:
+                self.save(filename, frame)
+                with self._lock:
+                    self.written += 1
+            except Exception as e:
+                print(f"Error saving {filename}: {e}")
+                with self._lock:
+                    self.failed += 1
@@ -0,0 +1,83 @@
+import numpy as np
+
+FRAME_SHAPE = (24, 32)
+RESUM_FRAMES = 4096  # the running sum is rebuilt from the ring this often
+
+
+class RollingFilter:
+    """
+    Temporal denoising over the last `window` frames.
+    Frames are copied into a preallocated (window, 24, 32) ring, so callers
+    may reuse their frame buffer, and the mean and EMA modes allocate nothing
+    per frame.
+
+    mode "mean":   running sum, add the new frame and subtract the one it
+                   replaces; constant time whatever the window.
+    mode "ema":    exponential moving average, alpha defaults to
+                   2 / (window + 1) (the mean's equivalent span); no ring.
+    mode "median": per-pixel median of the ring, robust to single-frame
+                   spikes; costs O(window) per pixel.
+    """
+
+    MODES = ("mean", "ema", "median")
+
+    def __init__(self, window, mode="mean", alpha=None, shape=FRAME_SHAPE):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown filter mode: {mode}")
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.window = window
+        self.mode = mode
+        self.alpha = alpha if alpha is not None else 2.0 / (window + 1)
+        self.ring = np.zeros((window if mode != "ema" else 0,) + shape, dtype=np.float32)
+        self._sum = np.zeros(shape, dtype=np.float64)
+        self.output = np.zeros(shape, dtype=np.float32)
+        self._step = np.zeros(shape, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        """Forget all frames, e.g. after the scene or the sensor settings changed."""
+        self.count = 0  # frames since reset
+        self._next = 0  # ring slot for the next frame
+        self._sum[...] = 0
+
+    @property
+    def ready(self):
+        """True once a full window of frames has been seen."""
+        return self.count >= self.window
+
+    def update(self, frame):
+        """
+        Add a frame (any shape with 24*32 values) and return the filtered
+        frame. The result is self.output, overwritten by the next update;
+        copy it to keep it.
+        """
+        frame = np.reshape(frame, self.output.shape)
+        self.count += 1
+        if self.mode == "ema":
+            if self.count == 1:
+                self.output[...] = frame
+            else:
+                # output += alpha * (frame - output)
+                np.subtract(frame, self.output, out=self._step)
+                self._step *= self.alpha
+                self.output += self._step
+            return self.output
+
+        slot = self.ring[self._next]
+        if self.mode == "mean":
+            if self.count > self.window:
+                self._sum -= slot
+            self._sum += frame
+        slot[...] = frame
+        self._next = (self._next + 1) % self.window
+        filled = min(self.count, self.window)
+
+        if self.mode == "mean":
+            if self.count % RESUM_FRAMES == 0:
+                # Drop the rounding the additions and subtractions built up
+                np.sum(self.ring[:filled], axis=0, dtype=np.float64, out=self._sum)
+            np.divide(self._sum, filled, out=self.output, casting="unsafe")
+        else:
+            np.median(self.ring[:filled], axis=0, out=self.output)
+        return self.output
@@ -0,0 +1,51 @@
+import numpy as np
+
+FRAME_SHAPE = (24, 32)
+DEAD_PIXEL_VALUE = -273.15  # what the MLX90640 drivers write for bad pixels
+
+
+class BadPixelFiller:
+    """
+    Interpolate broken/outlier pixels from their valid neighbours.
+    The neighbour table is built once, so filling a frame is a single gather
+    and weighted sum instead of a per-frame search.
+    """
+
+    def __init__(self, bad_pixels, shape=FRAME_SHAPE):
+        rows, cols = shape
+        bad = set(int(p) for p in bad_pixels)
+        self.bad_pixels = np.array(sorted(bad), dtype=np.intp)
+
+        # (n_bad, 4) neighbour indices; invalid slots point at pixel 0 with
+        # weight 0 so the gather stays rectangular
+        self.neighbours = np.zeros((self.bad_pixels.size, 4), dtype=np.intp)
+        self.weights = np.zeros((self.bad_pixels.size, 4), dtype=np.float32)
+        for i, pixel in enumerate(self.bad_pixels):
+            row, col = divmod(int(pixel), cols)
+            valid = [
+                r * cols + c
+                for r, c in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1))
+                if 0 <= r < rows and 0 <= c < cols and r * cols + c not in bad
+            ]
+            self.neighbours[i, :len(valid)] = valid
+            if valid:
+                self.weights[i, :len(valid)] = 1.0 / len(valid)
+
+    @classmethod
+    def from_sensor(cls, sensor):
+        """Build from an adafruit_mlx90640.MLX90640 after it read its EEPROM."""
+        return cls(list(sensor.brokenPixels) + list(sensor.outlierPixels))
+
+    @classmethod
+    def from_frame(cls, frame):
+        """Build from a frame that marks bad pixels with -273.15, e.g. frames
+        saved before the drivers interpolated them."""
+        return cls(np.flatnonzero(np.isclose(np.ravel(frame), DEAD_PIXEL_VALUE)))
+
+    def fill(self, frame):
+        """Fill the bad pixels of frame (any shape with 768 elements) in place
+        and return it."""
+        if self.bad_pixels.size:
+            flat = frame.reshape(-1)
+            flat[self.bad_pixels] = (flat[self.neighbours] * self.weights).sum(axis=1)
+        return frame
@@ -8,8 +8,13 @@ import tensorflow as tf
 import matplotlib.colors as mcolors
 import matplotlib.animation as animation
 import time
+import threading
 from PIL import Image
 import io
+from pixel_repair import BadPixelFiller
+from dataset_writer import DatasetWriter
+from frame_filter import RollingFilter
+from thermal_capture import ThermalCapture
 
 # Configuration
 NUM_IMAGES = 20
@@ -17,6 +22,20 @@ SAVE_DIR = "dataset"
 VMIN = 25.0
 VMAX = 32.0
 TARGET_SIZE = (24, 32)  # (height, width)
+# 1 MHz I2C leaves room for 16 Hz subpages (8 full frames/s). On the Pi's
+# hardware bus the speed is set by dtparam=i2c_arm_baudrate=1000000 in
+# /boot/config.txt; busio passes this value on where the bus allows it.
+I2C_FREQUENCY = 1000000
+REFRESH_RATE = adafruit_mlx90640.RefreshRate.REFRESH_16_HZ
+DISPLAY_INTERVAL_MS = 50  # redraw check; only new frames are drawn
+FRAME_TIMEOUT = 5.0  # seconds without a frame before giving up
+SAVE_FORMAT = "png"  # "png" (colormapped, as for training) or "npy" (raw temperatures)
+SAVE_WORKERS = 2  # threads encoding and writing dataset images
+SAVE_QUEUE_SIZE = 16  # averaged frames waiting for a writer
+# Temporal filter on the live view and its predictions (frame_filter.py);
+# a window of 1 shows every frame as read
+LIVE_FILTER_WINDOW = 1
+LIVE_FILTER_MODE = "mean"  # "mean", "ema" or "median"
 
 os.makedirs(SAVE_DIR, exist_ok=True)
 
@@ -29,17 +48,26 @@ except Exception as e:
 
 # Initialize Thermal Camera Sensor
 try:
-    i2c = busio.I2C(board.SCL, board.SDA, frequency=100000)
+    i2c = busio.I2C(board.SCL, board.SDA, frequency=I2C_FREQUENCY)
     thermal_camera = adafruit_mlx90640.MLX90640(i2c, address=0x33)
-    thermal_camera.refresh_rate = adafruit_mlx90640.RefreshRate.REFRESH_2_HZ
+    thermal_camera.refresh_rate = REFRESH_RATE
+    # Broken/outlier pixels come back as -273.15; interpolate them instead
+    bad_pixel_filler = BadPixelFiller.from_sensor(thermal_camera)
 except Exception as e:
     print(f"Error initializing thermal camera: {e}")
     thermal_camera = None
 
-# Frame buffer for averaging (used in saving images)
-frame = np.zeros((24 * 32,), dtype=np.float32)
+# Rolling average of the last few frames (used in saving images)
 frames_to_average = 5
-frame_buffer = []
+frame_averager = RollingFilter(frames_to_average)
+live_filter = RollingFilter(LIVE_FILTER_WINDOW, mode=LIVE_FILTER_MODE)
+
+# Live mode: the capture thread, and the latest prediction from the
+# inference thread
+capture = None
+people_count = 0
+display_frame = np.zeros(TARGET_SIZE, dtype=np.float32)
+display_sequence = 0
 
 # Define a custom colormap (the same one used during training)
 colors = [(0, 'black'), (0.2, 'darkred'), (0.3, 'red'), (0.4, 'orange'), (1, 'yellow')]
@@ -54,20 +82,27 @@ cbar.set_label('Normalized Intensity', rotation=270, labelpad=20)
 ax.set_xticks([])
 ax.set_yticks([])
 
+# uint8 RGB lookup table per colormap, built on first use
+colormap_luts = {}
+
 def apply_colormap(thermal_data, cmap_obj, vmin, vmax):
     """
-    Apply the custom colormap in a vectorized way.
+    Apply the custom colormap through a lookup table.
     thermal_data: 2D array of raw thermal values.
-    Returns an RGB image (uint8) with shape (H, W, 3).
+    Returns an RGB image (uint8) with shape (H, W, 3), identical to
+    converting cmap_obj's RGBA output, at the cost of one gather per frame.
     """
-    # Normalize data to [0, 1]
-    norm_data = (thermal_data - vmin) / (vmax - vmin)
-    norm_data = np.clip(norm_data, 0, 1)
-    # Apply the colormap (this returns an RGBA image with values in [0,1])
-    colored = cmap_obj(norm_data)
-    # Drop alpha channel and convert to uint8
-    colored = (colored[..., :3] * 255).astype(np.uint8)
-    return colored
+    lut = colormap_luts.get(id(cmap_obj))
+    if lut is None:
+        # One entry per colour of the colormap (256 by default)
+        lut = (cmap_obj(np.arange(cmap_obj.N))[:, :3] * 255).astype(np.uint8)
+        colormap_luts[id(cmap_obj)] = lut
+    # Scale to table indices; values outside [vmin, vmax] take the end
+    # colours, NaN the first one (fmax drops NaN before the integer cast)
+    index = (thermal_data - vmin) * (len(lut) / (vmax - vmin))
+    np.fmax(index, 0, out=index)
+    np.fmin(index, len(lut) - 1, out=index)
+    return lut[index.astype(np.intp)]
 
 def preprocess_image(thermal_image_data):
     """
@@ -103,74 +138,108 @@ def predict_people_count(thermal_image_data):
     else:
         return 0
 
-def average_frames(frames):
-    return np.mean(np.array(frames), axis=0)
+def save_png(filename, thermal_data):
+    """Same pixels as plt.imsave(filename, thermal_data, cmap=cm, vmin=VMIN, vmax=VMAX)."""
+    Image.fromarray(apply_colormap(thermal_data, cm, VMIN, VMAX)).save(filename)
 
 def save_frames(n_imgs):
     """
     Capture and save images from the thermal camera.
     Averaging a few frames can help reduce noise.
+    Frames are read on the ThermalCapture thread; this loop averages them and
+    the DatasetWriter's threads encode and write the files, so the sensor
+    keeps its refresh rate.
     """
     if not thermal_camera:
         print("Thermal camera not initialized.")
         return
-    for i in range(n_imgs):
-        try:
-            thermal_camera.getFrame(frame)
-            data_array = np.reshape(frame, (24, 32))
-            frame_buffer.append(data_array)
-            if len(frame_buffer) > frames_to_average:
-                frame_buffer.pop(0)
-            if len(frame_buffer) == frames_to_average:
-                avg_array = average_frames(frame_buffer)
-                filename = os.path.join(SAVE_DIR, f"new_frame_label_1_000{i:02d}.png")
-                plt.imsave(filename, avg_array, cmap=cm, vmin=VMIN, vmax=VMAX)
-                print(f"Saved {filename}")
-        except ValueError:
-            print("Frame read error, skipping.")
+    save = save_png if SAVE_FORMAT == "png" else np.save
+    # Frames from an earlier run must not leak into this one's averages
+    frame_averager.reset()
+    data = np.zeros(TARGET_SIZE, dtype=np.float32)
+    skipped = 0
+    with ThermalCapture(thermal_camera, bad_pixel_filler) as capture, \
+            DatasetWriter(save, workers=SAVE_WORKERS, queue_size=SAVE_QUEUE_SIZE) as writer:
+        sequence = 0
+        for i in range(n_imgs):
+            new_sequence, new_frame = capture.wait(sequence, timeout=FRAME_TIMEOUT, out=data)
+            if new_frame is None:
+                print("No frames from the thermal camera, stopping.")
+                break
+            # Frames captured while the writer held this loop up
+            skipped += new_sequence - sequence - 1
+            sequence = new_sequence
+            avg_array = frame_averager.update(new_frame)
+            if frame_averager.ready:
+                filename = os.path.join(SAVE_DIR, f"new_frame_label_1_000{i:02d}.{SAVE_FORMAT}")
+                writer.submit(filename, avg_array)
+        print(capture.stats())
+    print(f"{skipped} frames skipped; {writer.stats()}")
     print("Dataset image capture complete!")
 
+def run_inference(stop):
+    """
+    Inference thread: predict on each new frame from the capture thread.
+    Frames that arrive while a prediction runs are skipped, so a slow model
+    never holds up capture or drawing.
+    """
+    global people_count
+    data = np.zeros(TARGET_SIZE, dtype=np.float32)
+    sequence = 0
+    while not stop.is_set():
+        sequence, new_frame = capture.wait(sequence, timeout=1.0, out=data)
+        if new_frame is None:
+            continue
+        try:
+            people_count = predict_people_count(new_frame)
+        except Exception as e:
+            print(f"Prediction error: {e}")
+
 def update_frame_func(frame_number):
     """
     This function is called repeatedly by the animation.
-    It captures a new frame, processes it, updates the prediction,
-    and refreshes the displayed image.
+    It draws the newest captured frame, if there is one it has not drawn,
+    with the latest prediction.
     """
-    if not thermal_camera:
-        print("Thermal camera not initialized.")
-        return [thermal_image]
+    global display_sequence
     try:
-        thermal_camera.getFrame(frame)
-        raw_data = np.reshape(frame, (24, 32))
-        # Preprocess raw data for both prediction and display
-        processed_image = preprocess_image(raw_data)  # shape (1, 24, 32, 3)
-        display_img = processed_image[0]  # Remove batch dimension; values in [0,1]
-        
-        # Get prediction using the processed image
-        people_count = np.argmax(model.predict(processed_image, verbose=0), axis=1)[0]
-        ax.set_title(f"People Count: {people_count}")
+        sequence, raw_data = capture.latest(out=display_frame)
+        if sequence == display_sequence:
+            return [thermal_image]
+        display_sequence = sequence
+        # Same preprocessing as for prediction
+        display_img = preprocess_image(raw_data)[0]  # Remove batch dimension; values in [0,1]
+        ax.set_title(f"People Count: {people_count}   ({capture.fps:.1f} fps)")
         
         # Update the displayed image
         thermal_image.set_data(display_img)
         thermal_image.set_clim(0, 1)
         cbar.update_normal(thermal_image)
         return [thermal_image]
-    except ValueError as e:
-        print(f"Frame read error: {e}")
-        return [thermal_image]
     except Exception as e:
         print(f"Unexpected error: {e}")
         return [thermal_image]
 
 def main():
+    global capture
     try:
         s = int(input("Choose an action:\n(1) Save Thermal Images\t(2) Live CAM\n>>> "))
         if s == 1:
             save_frames(NUM_IMAGES)
         elif s == 2:
-            # Adjust the interval to match the sensor refresh rate (e.g., 500ms for 2Hz)
-            ani = animation.FuncAnimation(fig, update_frame_func, interval=500, blit=False, save_count=1000)
+            if not thermal_camera:
+                print("Thermal camera not initialized.")
+                return
+            # Capture, inference and drawing each run at their own pace
+            capture = ThermalCapture(thermal_camera, bad_pixel_filler, live_filter).start()
+            stop = threading.Event()
+            threading.Thread(target=run_inference, args=(stop,), name="inference", daemon=True).start()
+            ani = animation.FuncAnimation(fig, update_frame_func, interval=DISPLAY_INTERVAL_MS,
+                                          blit=False, save_count=1000)
             plt.show()
+            stop.set()
+            capture.stop()
+            print(capture.stats())
         else:
             print("Invalid choice. Exiting.")
     except Exception as e:
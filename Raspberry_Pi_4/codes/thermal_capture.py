@@ -0,0 +1,128 @@
+import collections
+import threading
+import time
+
+import numpy as np
+
+FRAME_SHAPE = (24, 32)
+# MLX90640 subpage rates for RefreshRate values 0..7; a full frame
+# (getFrame) is two subpages
+SUBPAGE_HZ = (0.5, 1, 2, 4, 8, 16, 32, 64)
+FPS_WINDOW = 32  # frames the measured capture rate is averaged over
+ERROR_BACKOFF_START = 0.01  # seconds after a failed read, doubling while
+ERROR_BACKOFF_MAX = 1.0  # reads keep failing
+ERROR_REPORT_EVERY = 100  # consecutive failures between reports
+
+
+class ThermalCapture:
+    """
+    Read an adafruit_mlx90640.MLX90640 continuously on its own thread.
+    Each frame is repaired (pixel_repair.BadPixelFiller), optionally filtered
+    (frame_filter.RollingFilter) and published to a latest-frame slot.
+    Consumers (display, inference, dataset capture) take the newest frame at
+    their own pace. A slow consumer skips frames and never delays the sensor;
+    one that keeps up sees every frame through wait().
+    """
+
+    def __init__(self, camera, filler=None, frame_filter=None):
+        self.camera = camera
+        self.filler = filler
+        self.frame_filter = frame_filter
+        self.sequence = 0  # frames published so far
+        self.errors = 0  # failed reads
+        self._raw = np.zeros((FRAME_SHAPE[0] * FRAME_SHAPE[1],), dtype=np.float32)
+        self._latest = np.zeros(FRAME_SHAPE, dtype=np.float32)
+        self._times = collections.deque(maxlen=FPS_WINDOW)
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    @property
+    def configured_fps(self):
+        """Full frames per second the sensor's refresh rate allows."""
+        return SUBPAGE_HZ[int(self.camera.refresh_rate)] / 2
+
+    @property
+    def fps(self):
+        """Measured full frames per second over the last FPS_WINDOW frames."""
+        with self._condition:
+            if len(self._times) < 2:
+                return 0.0
+            return (len(self._times) - 1) / (self._times[-1] - self._times[0])
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="thermal-capture", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def latest(self, out=None):
+        """(sequence, copy of the newest frame); sequence 0 means none yet."""
+        with self._condition:
+            if out is None:
+                out = self._latest.copy()
+            else:
+                out[...] = self._latest
+            return self.sequence, out
+
+    def wait(self, after, timeout=None, out=None):
+        """Like latest(), once a frame newer than sequence `after` is published.
+        Returns (after, None) on timeout or when capture stops."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.sequence > after or not self._running, timeout)
+            if self.sequence <= after:
+                return after, None
+            return self.latest(out)
+
+    def stats(self):
+        return (f"capturing at {self.fps:.2f} fps (sensor set to {self.configured_fps:g} fps), "
+                f"{self.sequence} frames, {self.errors} read errors")
+
+    def _run(self):
+        failures = 0  # consecutive
+        backoff = ERROR_BACKOFF_START
+        while self._running:
+            try:
+                self.camera.getFrame(self._raw)
+            except (RuntimeError, ValueError, OSError) as e:
+                # "Too many retries" / "Frame data error" from the driver, or
+                # an I2C error at high bus speed. Back off so an unplugged
+                # sensor does not spin this thread, and report the first
+                # failure and then every ERROR_REPORT_EVERY-th.
+                self.errors += 1
+                failures += 1
+                if failures % ERROR_REPORT_EVERY == 1:
+                    print(f"Frame read error ({failures} in a row): {e}")
+                with self._condition:
+                    # stop() cuts the wait short
+                    self._condition.wait_for(lambda: not self._running, backoff)
+                backoff = min(backoff * 2, ERROR_BACKOFF_MAX)
+                continue
+            if failures:
+                print(f"Frame reads recovered after {failures} errors")
+                failures = 0
+                backoff = ERROR_BACKOFF_START
+            if self.filler:
+                self.filler.fill(self._raw)
+            if self.frame_filter:
+                frame = self.frame_filter.update(self._raw)
+            else:
+                frame = np.reshape(self._raw, FRAME_SHAPE)
+            with self._condition:
+                self._latest[...] = frame
+                self.sequence += 1
+                self._times.append(time.monotonic())
+                self._condition.notify_all()